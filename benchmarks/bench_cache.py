@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the write throughput and lookup latency of the episode cache, and
+the cost of refreshing shows that gained one new episode by replacing them
+against merging the changes in.
+
+    python benchmarks/bench_cache.py [shows] [episodes_per_show]
+"""
+from __future__ import unicode_literals, print_function
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+from eplist.cache import Cache
+from eplist.episode import Episode
+
+
+def make_show(num, episodes):
+    eps = [Episode(title="Episode {}".format(i), number=i, count=i)
+           for i in range(1, episodes + 1)]
+    spc = [Episode(title="Special {}".format(i), number=i, type="OVA")
+           for i in range(1, 11)]
+    return ("benchmark show {}".format(num), eps, spc)
+
+
+def report(label, rows, elapsed):
+    print("{:<22} {:>9} rows {:>8.3f}s {:>12.0f} rows/s".format(
+          label, rows, elapsed, rows / elapsed))
+
+
+def written(label, rows, elapsed):
+    print("{:<22} {:>9} rows written {:>8.3f}s".format(label, rows, elapsed))
+
+
+def main(num_shows=200, episodes=1000):
+    shows = [make_show(i, episodes) for i in range(num_shows)]
+    rows = sum(len(eps) + len(spc) for _, eps, spc in shows)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        cache = Cache(os.path.join(temp_dir, 'single.db'))
+        start = time.time()
+        for title, eps, spc in shows:
+            cache.add_show(title, eps, spc)
+        report("add_show (per show)", rows, time.time() - start)
+        cache.close()
+
+        cache = Cache(os.path.join(temp_dir, 'bulk.db'))
+        start = time.time()
+        inserted = cache.add_shows(iter(shows))
+        report("add_shows (bulk)", inserted, time.time() - start)
+
+        lookups = [title for title, _, _ in random.sample(shows, min(100, num_shows))]
+        start = time.time()
+        for title in lookups:
+            cache.get_episodes(title)
+        elapsed = time.time() - start
+        print("get_episodes           {:>9} shows {:>8.3f}ms per lookup".format(
+              num_shows, elapsed * 1000 / len(lookups)))
+
+        ## Every show gets one new episode, like a weekly update
+        updated = []
+        for title, eps, spc in shows:
+            new = Episode(title="Episode {}".format(len(eps) + 1),
+                          number=len(eps) + 1, count=len(eps) + 1)
+            updated.append((title, eps + [new] + spc))
+
+        conn = cache.connection
+        before = conn.total_changes
+        start = time.time()
+        for title, eps in updated:
+            cache.add_show(title, eps, [])
+        written("add_show (replace)", conn.total_changes - before, time.time() - start)
+
+        before = conn.total_changes
+        start = time.time()
+        for title, eps in updated:
+            eps.insert(-10, Episode(title="Episode {}".format(len(eps) - 9),
+                                    number=len(eps) - 9, count=len(eps) - 9))
+            cache.refresh_show(title, eps)
+        written("refresh_show", conn.total_changes - before, time.time() - start)
+        cache.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
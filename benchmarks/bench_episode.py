@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the memory use and attribute access speed of the slotted Episode
+records against the old dictionary backed ones.
+
+    python benchmarks/bench_episode.py [episodes]
+"""
+from __future__ import unicode_literals, print_function
+
+import sys
+import timeit
+
+from eplist import utils
+from eplist.episode import Episode
+from eplist.constants import AttributeDict
+
+
+class DictEpisode(AttributeDict):
+    """ The Episode implementation before it was slotted """
+    def __init__(self, **kwargs):
+        super(DictEpisode, self).__init__(kwargs)
+        self.title = utils.encode(kwargs['title'])
+        self.season = int(kwargs.get('season', 1))
+        self.number = int(kwargs['number'])
+        self.count = int(kwargs.get('count', '-1'))
+        self.type = kwargs.get('type', 'Episode')
+        self.file = kwargs.get('file', None)
+        self.is_special = (self.type.lower() != "episode")
+
+
+def make_episodes(cls, num):
+    return [cls(title="Episode {}".format(i), number=i, count=i)
+            for i in range(1, num + 1)]
+
+
+def footprint(episodes):
+    """ Bytes used by the records themselves, not the values they hold """
+    return sum(sys.getsizeof(ep) for ep in episodes)
+
+
+def access(episodes):
+    for ep in episodes:
+        ep.title, ep.season, ep.number, ep.count, ep.is_special
+
+
+def main(num=5000):
+    for cls in (DictEpisode, Episode):
+        episodes = make_episodes(cls, num)
+        size = footprint(episodes)
+        elapsed = min(timeit.repeat(lambda: access(episodes), number=5, repeat=3))
+
+        print("{:<12} {:>8} episodes {:>10.1f} KiB {:>8.2f}ms per pass".format(
+              cls.__name__, num, size / 1024.0, elapsed * 1000 / 5))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how quickly the EpisodeFormatter renders a large show.
+
+    python benchmarks/bench_formatter.py [episodes] [format]
+"""
+from __future__ import unicode_literals, print_function
+
+import sys
+import time
+
+from eplist.episode import Episode, EpisodeFormatter, Show
+
+
+def make_show(num):
+    eps = [Episode(title="Episode {}".format(i), number=i % 100 + 1,
+                   season=i // 100 + 1, count=i + 1) for i in range(num)]
+    return Show("benchmark show", eps)
+
+
+def main(num=100000, fmt="<series:proper> - S<season:pad>E<epnum:pad> - <title:upper> [<count:pad>]"):
+    num = int(num)
+    show = make_show(num)
+    formatter = EpisodeFormatter(show, fmt)
+
+    start = time.time()
+    for ep in show.episodes:
+        formatter.display(ep)
+    elapsed = time.time() - start
+
+    report("display", num, elapsed)
+
+    start = time.time()
+    list(formatter.display_many(show.episodes))
+    report("display_many", num, time.time() - start)
+
+
+def report(label, num, elapsed):
+    print("{:<12} {:>8} episodes {:>8.3f}s {:>10.0f} episodes/s".format(
+          label, num, elapsed, num / elapsed))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the old line by line CRC32 calculation against the block and mmap
+readers of the hashing engine, then hashing every digest in one pass against
+a pass for each digest.  ED2K falls back to a pure python MD4 when OpenSSL
+doesn't provide one, which will dominate the digest timings.
+
+    python benchmarks/bench_hashing.py [megabytes]
+"""
+from __future__ import unicode_literals, print_function, division
+
+import os
+import sys
+import zlib
+import time
+import tempfile
+
+from eplist import hashing
+from eplist.hashing import FileHasher
+
+
+def legacy_crc32(path):
+    """ EpisodeFile.crc32 before the hashing engine """
+    with open(path, 'rb') as ep_file:
+        checksum = 0
+        for line in ep_file:
+            checksum = zlib.crc32(line, checksum)
+
+    return checksum & 0xFFFFFFFF
+
+
+def make_file(megabytes):
+    fd, path = tempfile.mkstemp(suffix='.mkv')
+    chunk = os.urandom(2 ** 20)
+    for _ in range(megabytes):
+        os.write(fd, chunk)
+    os.close(fd)
+    return path
+
+
+def separate_passes(path):
+    hasher = FileHasher()
+    digests = {}
+    for name in hashing.algorithms:
+        digests.update(hasher.digests(path, [name]))
+    return int(digests['crc32'], base=16)
+
+
+def single_pass(path):
+    return int(FileHasher().digests(path)['crc32'], base=16)
+
+
+def timed(func, path):
+    start = time.time()
+    checksum = func(path)
+    return checksum, time.time() - start
+
+
+def main(megabytes=256):
+    path = make_file(megabytes)
+
+    try:
+        runs = [
+            ('lines', legacy_crc32),
+            ('blocks', FileHasher(use_mmap=False).crc32),
+            ('mmap', FileHasher(use_mmap=True).crc32),
+            ('3 passes', separate_passes),
+            ('1 pass', single_pass),
+        ]
+
+        for name, func in runs:
+            checksum, elapsed = timed(func, path)
+            print("{:<10} {:>6} MB {:>10.1f} MB/s  {:08X}".format(
+                  name, megabytes, megabytes / elapsed, checksum))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
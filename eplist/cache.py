@@ -6,10 +6,18 @@ on the internet
 from __future__ import unicode_literals
 
 import os
+import gzip
+import json
 import datetime
 import logging
+import weakref
+import threading
 
-from itertools import chain
+from functools import partial
+from contextlib import contextmanager
+from operator import itemgetter
+from itertools import chain, groupby
+from collections import OrderedDict, defaultdict
 
 from sqlite3 import PARSE_DECLTYPES, connect, OperationalError
 
@@ -20,7 +28,11 @@ from eplist.settings import Settings
 
 
 class Cache(object):
-    """ Our database logic class"""
+    """
+    Our database logic class.  Every thread that touches the cache is handed
+    its own connection, file backed databases run in WAL mode so readers
+    never block behind a writer.
+    """
     def __init__(self, dbName=""):
         """Establish a connection to the show database"""
 
@@ -30,53 +42,342 @@ class Cache(object):
         if dbName != ':memory:':
             dbName = os.path.join(resource_path, dbName)
 
+        self.db_name = dbName
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._releases = set()
+        self._refreshing = {}
+        self._accessed = {}
+        self.memory_cache = MemoryCache(Settings.memory_cache_size)
+
         try:
-            self.connection = connect(dbName, detect_types=PARSE_DECLTYPES)
             logging.debug("Creating database: {}".format(dbName))
-            self.connection.executescript(create_database)
+            self.migrate()
         except OperationalError as reason:
             logging.error("Error connecting to database: {}".format(reason))
+            self.close()
             raise reason
-        else:
-            #Make sure everything is utf-8
-            self.connection.text_factory = lambda x: utils.encode(x)
+
+    @property
+    def connection(self):
+        """ The connection belonging to the calling thread """
+        holder = getattr(self._local, 'holder', None)
+
+        if holder is None:
+            holder = _ThreadConnection(self._connect())
+            self._local.holder = holder
+
+            # The holder goes away with the thread's locals once the thread
+            # exits, the connection is closed along with it
+            if self.db_name != ':memory:':
+                with self._lock:
+                    self._releases.add(
+                        weakref.ref(holder, partial(self._release, holder.conn)))
+
+        return holder.conn
+
+    def _connect(self):
+        """
+        Open a new connection to the database.  An in memory database only
+        exists for the connection that created it so every thread has to
+        share that single connection instead.
+        """
+        with self._lock:
+            if self.db_name == ':memory:' and self._connections:
+                return self._connections[0]
+
+            conn = connect(self.db_name, detect_types=PARSE_DECLTYPES,
+                           timeout=Settings.db_timeout,
+                           check_same_thread=False)
+            self._connections.append(conn)
+
+        #Make sure everything is utf-8
+        conn.text_factory = lambda x: utils.encode(x)
+        conn.execute("PRAGMA foreign_keys = ON")
+
+        if self.db_name != ':memory:':
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+
+        return conn
+
+    def _release(self, conn, ref):
+        """ Close the connection of a thread that has exited """
+        with self._lock:
+            self._releases.discard(ref)
+
+            if conn not in self._connections:
+                return
+
+            self._connections.remove(conn)
+
+        conn.close()
+
+    @property
+    def schema_version(self):
+        """ The version of the schema the database is currently at """
+        curs = self.connection.execute("SELECT MAX(version) FROM schema_version")
+        return curs.fetchone()[0] or 0
+
+    def migrate(self):
+        """
+        Bring the database schema up to date by running every migration newer
+        than the stored schema version, each one within its own transaction
+        """
+        with self._write_lock() as conn:
+            conn.execute(create_schema_version)
+            current = self.schema_version
+
+        for version in range(current + 1, len(migrations) + 1):
+            with self._write_lock() as conn:
+                # Another connection may have migrated the database while we
+                # waited for the lock
+                if self.schema_version >= version:
+                    continue
+
+                logging.info("Migrating the cache to schema version {}".format(version))
+
+                try:
+                    for statement in migrations[version - 1].split(';'):
+                        if statement.strip():
+                            conn.execute(statement)
+                except OperationalError as reason:
+                    logging.error("Migration {} failed: {}".format(version, reason))
+                    raise
+
+                conn.execute("INSERT INTO schema_version VALUES (?)", (version,))
+
+    @contextmanager
+    def _write_lock(self):
+        """
+        Run the block within a transaction that holds the database's write
+        lock from the start, so concurrent connections changing the schema
+        are serialized.  executescript would commit the transaction early
+        so statements have to be executed one at a time within the block
+        """
+        conn = self.connection
+        isolation, conn.isolation_level = conn.isolation_level, None
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            conn.execute("COMMIT")
+        finally:
+            conn.isolation_level = isolation
 
     def close(self):
-        """ Commits any changes to the database then closes connections to it"""
-        self.connection.commit()
-        self.connection.close()
+        """
+        Commits any changes to the database then closes every thread's
+        connection to it
+        """
+        self.wait_for_refreshes(Settings.db_refresh_wait)
+        self._flush_access()
+
+        with self._lock:
+            connections, self._connections = self._connections, []
+
+        for conn in connections:
+            conn.commit()
+            conn.close()
+
         logging.info("Connections have been closed")
 
     def add_show(self, showTitle, episodes=None, specials=None):
         """ If we find a show on the internet that is not in our database
-        we can use this function to add it into our database for the future"""
-        if not showTitle:
-            raise ValueError("Empty show title passed to add_specials")
+        we can use this function to add it into our database for the future.
+        A show that is already cached has its episodes replaced"""
+        _validate_show(showTitle, episodes, specials)
 
-        if not episodes and not specials:
-            raise ValueError("Empty specials/episode list passed")
+        with self.connection as conn:
+            sid, _ = self._store_show(conn, showTitle,
+                                      _episode_rows(chain(episodes, specials)))
 
-        if not isinstance(episodes, list) or not isinstance(specials, list):
-            raise ValueError("Episode/specials must be in a list")
+        self._forget([sid])
+        self.enforce_budget()
 
-        title = showTitle
-        time = datetime.datetime.now()
+    def add_shows(self, shows):
+        """
+        Bulk insert an iterable of (title, episodes, specials) tuples.  Every
+        show is written within a single transaction, the number of episode
+        rows inserted is returned
+        """
+        rows = 0
+        sids = []
 
         with self.connection as conn:
-            curs = conn.execute(
-                    "INSERT INTO shows values (NULL, ?, ?)",
-                    (title, time))
+            for showTitle, episodes, specials in shows:
+                _validate_show(showTitle, episodes, specials)
+                sid, count = self._store_show(
+                    conn, showTitle, _episode_rows(chain(episodes, specials)))
+                sids.append(sid)
+                rows += count
+
+        self._forget(sids)
+        self.enforce_budget()
+
+        return rows
+
+    def _store_show(self, conn, title, rows, time=None):
+        """
+        Store the show and its episode rows, tuples of (title, season,
+        number, count, type), using the connection passed.  If the show is
+        already cached it keeps its id, and with it any aliases, but its
+        episodes are replaced.  The caller is responsible for the
+        transaction.  Returns the show id and the number of episode rows
+        """
+        if time is None:
+            time = datetime.datetime.now()
+
+        now = datetime.datetime.now()
+
+        conn.execute("DELETE FROM not_found WHERE title=?", (title,))
 
+        curs = conn.execute("SELECT sid FROM shows WHERE title=?", (title,))
+        show = curs.fetchone()
+
+        if show:
+            showId = show[0]
+            conn.execute("DELETE FROM episodes WHERE sid=?", (showId,))
+            conn.execute("UPDATE shows SET time=?, last_access=? WHERE sid=?",
+                         (time, now, showId))
+        else:
+            # The title now belongs to a show of its own rather than another
+            # show it used to be an alias of
+            conn.execute("DELETE FROM aliases WHERE alias=?", (title,))
+            self.memory_cache.invalidate(title)
+            curs = conn.execute(
+                "INSERT INTO shows (sid, title, time, last_access) VALUES (NULL, ?, ?, ?)",
+                (title, time, now))
             showId = curs.lastrowid
 
+        rows = [(showId,) + tuple(row) for row in rows]
+
+        conn.executemany(
+            "INSERT INTO episodes values (NULL, ?, ?, ?, ?, ?, ?)", rows)
+
+        return showId, len(rows)
+
+    def refresh_show(self, showTitle, episodes):
+        """
+        Bring the cached copy of the show up to date with the episodes
+        passed.  Rather than replacing every episode the new list is compared
+        against the cached rows by (type, season, number) and only the
+        episodes that were added, changed or removed are written, all in one
+        transaction.  New episodes are listed after the ones already cached.
+        Returns a tuple of the number of episodes (inserted, updated, deleted)
+        """
+        if not showTitle:
+            raise ValueError("Empty show title passed to refresh_show")
+
+        now = datetime.datetime.now()
+
+        with self.connection as conn:
+            conn.execute("DELETE FROM not_found WHERE title=?", (showTitle,))
+
+            curs = conn.execute("SELECT sid FROM shows WHERE title=?", (showTitle,))
+            show = curs.fetchone()
+
+            if not show:
+                sid, inserted = self._store_show(conn, showTitle, _episode_rows(episodes))
+                changes = (inserted, 0, 0)
+            else:
+                sid = show[0]
+                changes = self._merge_episodes(conn, sid, episodes)
+                conn.execute("UPDATE shows SET time=?, last_access=? WHERE sid=?",
+                             (now, now, sid))
+
+        logging.info("Refreshed {}: {} inserted, {} updated, {} deleted".format(
+                     showTitle, *changes))
+
+        self._forget([sid])
+        self.enforce_budget()
+
+        return changes
+
+    def _merge_episodes(self, conn, sid, episodes):
+        """
+        Diff the episodes against the rows cached for the show id and write
+        the differences using the connection passed.  Episodes sharing a key
+        are paired up in the order they appear.  Returns a tuple of the number
+        of rows (inserted, updated, deleted)
+        """
+        cached = defaultdict(list)
+        curs = conn.execute("SELECT eid, title, season, number, count, type "
+                            "FROM episodes WHERE sid=? ORDER BY eid", (sid,))
+        for eid, title, season, number, count, type_ in curs:
+            cached[(type_, season, number)].append((eid, title, count))
+
+        inserts = []
+        updates = []
+
+        for title, season, number, count, type_ in _episode_rows(episodes):
+            rows = cached.get((type_, season, number))
+
+            if not rows:
+                inserts.append((sid, title, season, number, count, type_))
+                continue
+
+            eid, old_title, old_count = rows.pop(0)
+            if (old_title, old_count) != (title, count):
+                updates.append((title, count, eid))
+
+        deletes = [(eid,) for rows in cached.values() for eid, _, _ in rows]
+
+        conn.executemany("DELETE FROM episodes WHERE eid=?", deletes)
+        conn.executemany("UPDATE episodes SET title=?, count=? WHERE eid=?", updates)
+        conn.executemany("INSERT INTO episodes VALUES (NULL, ?, ?, ?, ?, ?, ?)", inserts)
+
+        return len(inserts), len(updates), len(deletes)
+
+    def add_alias(self, alias, showTitle):
+        """
+        Map an alternate title onto a cached show so lookups using the alias
+        are served from the cache.  A show stored under the alias is replaced
+        by the one it now maps to, along with its own aliases.  Returns false
+        if the show isn't cached
+        """
+        if not alias or not showTitle:
+            raise ValueError("Empty title passed to add_alias")
+
+        if alias == showTitle:
+            return True
+
         with self.connection as conn:
-            for eps in chain(episodes, specials):
-                show_info = (showId, eps.title, eps.season, eps.number,
-                        eps.count, eps.type,)
+            show = conn.execute("SELECT sid FROM shows WHERE title=?",
+                                (showTitle,)).fetchone()
+
+            if not show:
+                return False
+
+            old = conn.execute("SELECT sid FROM shows WHERE title=?",
+                               (alias,)).fetchone()
+
+            if old:
+                conn.execute("UPDATE aliases SET sid=? WHERE sid=?", show + old)
+                conn.execute("DELETE FROM episodes WHERE sid=?", old)
+                conn.execute("DELETE FROM shows WHERE sid=?", old)
+
+            conn.execute("INSERT OR REPLACE INTO aliases VALUES (?, ?)",
+                         (alias, show[0]))
 
-                conn.execute(
-                    "INSERT INTO episodes values (NULL, ?, ?, ?, ?, ?, ?)",
-                    show_info)
+        if old:
+            self._forget(old)
+
+        self.memory_cache.invalidate(alias)
+
+        return True
+
+    def _forget(self, sids):
+        """ Drop the shows with the ids passed from the memory cache """
+        sids = set(sids)
+        self.memory_cache.invalidate_if(lambda entry: entry[0] in sids)
 
     def remove_show(self, sid):
         """Removes show and episodes matching the show id """
@@ -85,51 +386,377 @@ class Cache(object):
             conn.execute("DELETE FROM episodes where sid=?", sid)
             conn.execute("DELETE FROM shows where sid=?", sid)
 
-    def get_episodes(self, showTitle, expiration=None):
-        """Returns the episodes associated with the show id"""
-        if not showTitle:
-            raise ValueError("get_episodes expects a string")
+        self._forget(sid)
+
+    def enforce_budget(self, max_shows=None, max_episodes=None):
+        """
+        Evict the least recently used shows until the cache fits within the
+        show and episode budgets, a budget of 0 means unlimited.  Returns
+        the number of shows evicted
+        """
+        if max_shows is None:
+            max_shows = Settings.db_max_shows
+
+        if max_episodes is None:
+            max_episodes = Settings.db_max_episodes
+
+        if not max_shows and not max_episodes:
+            return 0
+
+        self._flush_access()
 
-        title = (showTitle, )
         query = """
-            SELECT e.title, e.season, e.number, e.count, e.type, s.sid, s.time
-            FROM episodes AS e INNER JOIN shows AS s
-            ON s.sid=e.sid AND s.title=?
+            SELECT s.sid, COUNT(e.eid)
+            FROM shows AS s LEFT JOIN episodes AS e ON e.sid=s.sid
+            GROUP BY s.sid
+            ORDER BY s.last_access DESC, s.sid DESC
             """
 
+        evicted = []
+        shows = episodes = 0
+
         with self.connection as conn:
-            curs = conn.execute(query, title)
-            result = curs.fetchall()
+            for sid, rows in conn.execute(query).fetchall():
+                shows += 1
+                episodes += rows
 
-        eps = []
+                if ((max_shows and shows > max_shows) or
+                        (max_episodes and episodes > max_episodes)):
+                    evicted.append((sid,))
 
-        if not result:
-            return eps
+            conn.executemany("DELETE FROM episodes WHERE sid=?", evicted)
+            conn.executemany("DELETE FROM shows WHERE sid=?", evicted)
 
-        diffDays = (datetime.datetime.now() - result[0][-1])
+        if evicted:
+            logging.info("Evicted {} shows from the cache".format(len(evicted)))
+            self._forget(row[0] for row in evicted)
 
-        logging.info("{} days old".format(diffDays.days))
+        return len(evicted)
+
+    def compact(self, expiration=None):
+        """
+        Prune the expired shows, trim the cache down to its budget then
+        rebuild the database file to reclaim the free space.  Returns the
+        number of shows removed
+        """
+        if not expiration:
+            expiration = Settings.db_update
+
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=expiration)
+
+        with self.connection as conn:
+            conn.execute("DELETE FROM episodes WHERE sid IN "
+                         "(SELECT sid FROM shows WHERE time<=?)", (cutoff,))
+            curs = conn.execute("DELETE FROM shows WHERE time<=?", (cutoff,))
+            removed = curs.rowcount
+
+        self.memory_cache.clear()
+        removed += self.enforce_budget()
+        self.purge_not_found(Settings.not_found_ttl)
+
+        self.connection.execute("VACUUM")
+        logging.info("Compacted the cache, {} shows removed".format(removed))
+
+        return removed
+
+    def add_not_found(self, showTitle):
+        """
+        Remember that the show couldn't be located online so we don't poll
+        the web sources for it again until the entry expires
+        """
+        if not showTitle:
+            raise ValueError("Empty show title passed to add_not_found")
+
+        with self.connection as conn:
+            conn.execute("INSERT OR REPLACE INTO not_found VALUES (?, ?)",
+                         (showTitle, datetime.datetime.now()))
+
+    def is_not_found(self, showTitle, ttl=None):
+        """
+        Returns true if the show was recently looked up and not found, the
+        ttl is in hours and defaults to the not_found_ttl setting
+        """
+        if ttl is None:
+            ttl = Settings.not_found_ttl
+
+        cutoff = datetime.datetime.now() - datetime.timedelta(hours=ttl)
+
+        curs = self.connection.execute(
+            "SELECT 1 FROM not_found WHERE title=? AND time>?",
+            (showTitle, cutoff))
+
+        return curs.fetchone() is not None
+
+    def purge_not_found(self, ttl=None):
+        """
+        Remove the negative entries, if a ttl in hours is passed only the
+        entries older than it are removed.  Returns the number removed
+        """
+        with self.connection as conn:
+            if ttl is None:
+                curs = conn.execute("DELETE FROM not_found")
+            else:
+                cutoff = datetime.datetime.now() - datetime.timedelta(hours=ttl)
+                curs = conn.execute("DELETE FROM not_found WHERE time<=?",
+                                    (cutoff,))
+
+        return curs.rowcount
+
+    def get_episodes(self, showTitle, expiration=None, refresh=None):
+        """
+        Returns the episodes associated with the show title.  If the show has
+        expired and a refresh callable is passed the stale episodes are
+        returned right away while the callable fetches a fresh copy in the
+        background, otherwise nothing is returned so the caller fetches a
+        fresh copy itself.  The stale rows are kept so the fresh copy can be
+        merged into them with refresh_show.
+        """
+        if not showTitle:
+            raise ValueError("get_episodes expects a string")
 
         if not expiration:
             expiration = Settings.db_update
 
-        if diffDays.days >= expiration:
-            #If the show is older than a week remove it then return not found
+        now = datetime.datetime.now()
+        fresh = lambda entry: (now - entry[1]).days < expiration
+
+        entry = self.memory_cache.get(showTitle, fresh)
+        if entry is not None:
+            self._record_access(entry[0], now)
+            return _build_episodes(entry[2])
+
+        show = self.connection.execute(find_show, (showTitle, showTitle)).fetchone()
+
+        if not show:
+            return []
+
+        sid, title, time = show
+        rows = tuple(self.connection.execute(find_episodes, (sid,)).fetchall())
+
+        if not rows:
+            return []
+
+        diffDays = (now - time)
+
+        logging.info("{} days old".format(diffDays.days))
+
+        stale = diffDays.days >= expiration
+
+        if stale and refresh is None:
             logging.warning("Show is older than a week, updating...")
-            sid = result[0][-2]
-            self.remove_show(sid)
-            return eps
+            return []
+
+        if stale:
+            logging.warning("Show is older than a week, updating in the background")
+            # Refresh the show under its own title, not the alias we matched
+            self._revalidate(title, refresh)
+
+        self._record_access(sid, now)
+
+        # Only the plain rows are kept in memory, every lookup is handed its
+        # own episodes since callers attach their files to them
+        if not stale:
+            self.memory_cache.put(showTitle, (sid, time, rows))
+
+        return _build_episodes(rows)
+
+    def _record_access(self, sid, time):
+        """
+        Remember when the show was read.  Lookups don't write to the
+        database so they never wait on its write lock, the access times are
+        written later by _flush_access
+        """
+        with self._lock:
+            self._accessed[sid] = time
+
+    def _flush_access(self):
+        """
+        Write the access times of the shows that have been read to the
+        database so the least recently used shows are evicted first
+        """
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+
+        if not accessed:
+            return
+
+        with self.connection as conn:
+            conn.executemany("UPDATE shows SET last_access=? WHERE sid=?",
+                             ((time, sid) for sid, time in accessed.items()))
+
+    def _revalidate(self, showTitle, refresh):
+        """
+        Fetch a fresh copy of the show on a background thread, only one
+        refresh per show will be in flight at a time
+        """
+        with self._lock:
+            if showTitle in self._refreshing:
+                return
+
+            thread = threading.Thread(target=self._refresh_show,
+                                      args=(showTitle, refresh))
+            thread.daemon = True
+            self._refreshing[showTitle] = thread
+
+        thread.start()
+
+    def _refresh_show(self, showTitle, refresh):
+        """ Runs the refresh callable and merges in the episodes it returns """
+        try:
+            episodes = refresh()
+
+            if episodes:
+                self.refresh_show(showTitle, episodes)
+                logging.info("Refreshed {} in the background".format(showTitle))
+            else:
+                logging.warning("Unable to refresh {}, keeping the stale copy".format(showTitle))
+        except Exception:
+            logging.exception("Background refresh of {} failed".format(showTitle))
+        finally:
+            with self._lock:
+                self._refreshing.pop(showTitle, None)
+
+    def wait_for_refreshes(self, timeout=None):
+        """
+        Block until the background refreshes finish or the timeout, in
+        seconds, has passed
+        """
+        with self._lock:
+            threads = list(self._refreshing.values())
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def get_digests(self, identity):
+        """
+        Returns a dictionary of the hex digests stored for the file identity,
+        a tuple of (device, inode, size, mtime) from utils.file_identity.
+        Digests that haven't been calculated are left out
+        """
+        curs = self.connection.execute(
+            "SELECT crc32, md5, ed2k FROM checksums WHERE device=? AND inode=? "
+            "AND size=? AND mtime=?", identity)
+        row = curs.fetchone()
+
+        if not row:
+            return {}
+
+        crc, md5, ed2k = row
+        digests = {'crc32': "{:08x}".format(crc), 'md5': md5, 'ed2k': ed2k}
+
+        return dict((k, v) for k, v in digests.items() if v is not None)
+
+    def store_digests(self, identity, digests):
+        """
+        Remember the hex digests for the file identity, they are merged with
+        the ones already stored for the same version of the file.  The CRC32
+        has to be known to store anything.
+        """
+        with self.connection as conn:
+            merged = self.get_digests(identity)
+            merged.update(digests)
+
+            conn.execute("INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         tuple(identity) + (int(merged['crc32'], base=16),
+                         merged.get('md5'), merged.get('ed2k')))
+
+    def get_checkpoint(self, identity, names):
+        """
+        Returns the (offset, state) saved part way through hashing the file
+        identity with the digests named, or None.  See hashing.FileHasher
+        """
+        curs = self.connection.execute(
+            "SELECT offset, state FROM hash_checkpoints WHERE device=? "
+            "AND inode=? AND size=? AND mtime=? AND digests=?",
+            tuple(identity) + (_digest_key(names),))
+        row = curs.fetchone()
+
+        return (row[0], json.loads(row[1])) if row else None
+
+    def store_checkpoint(self, identity, names, offset, state):
+        """
+        Save how far hashing the file identity with the digests named has
+        got, replacing any earlier checkpoint of the file
+        """
+        with self.connection as conn:
+            conn.execute("INSERT OR REPLACE INTO hash_checkpoints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         tuple(identity) + (_digest_key(names), offset, json.dumps(state)))
+
+    def clear_checkpoint(self, identity):
+        """ Forget the checkpoint of the file once it has been hashed """
+        with self.connection as conn:
+            conn.execute("DELETE FROM hash_checkpoints WHERE device=? AND inode=?",
+                         tuple(identity)[:2])
+
+    def export_snapshot(self, path):
+        """
+        Stream every show and its episodes into a gzipped snapshot file that
+        can be loaded into another cache with import_snapshot.  Returns the
+        number of shows written
+        """
+        query = """
+            SELECT s.sid, s.title, s.time,
+                   e.title, e.season, e.number, e.count, e.type
+            FROM shows AS s INNER JOIN episodes AS e ON e.sid=s.sid
+            ORDER BY s.sid, e.eid
+            """
+
+        header = dict(format=snapshot_format, version=snapshot_version)
+        shows = 0
+
+        aliases = {}
+        for alias, sid in self.connection.execute("SELECT alias, sid FROM aliases"):
+            aliases.setdefault(sid, []).append(alias)
+
+        with gzip.open(path, 'wb') as snapshot:
+            snapshot.write(_snapshot_line(header))
+
+            curs = self.connection.execute(query)
+            for sid, rows in groupby(curs, key=itemgetter(0)):
+                rows = list(rows)
+                show = dict(title=rows[0][1], time=str(rows[0][2]),
+                            episodes=[row[3:] for row in rows],
+                            aliases=aliases.get(sid, []))
+                snapshot.write(_snapshot_line(show))
+                shows += 1
+
+        logging.info("Exported {} shows to {}".format(shows, path))
+        return shows
+
+    def import_snapshot(self, path):
+        """
+        Load a snapshot written by export_snapshot within a single
+        transaction, shows already in the cache are replaced by the copy in
+        the snapshot.  Returns the number of shows imported
+        """
+        shows = 0
+
+        with gzip.open(path, 'rb') as snapshot:
+            header = json.loads(snapshot.readline().decode('utf-8') or '{}')
+
+            if header.get('format') != snapshot_format:
+                raise ValueError("{} is not an eplist snapshot".format(path))
+
+            if header.get('version') != snapshot_version:
+                msg = "Unsupported snapshot version: {}"
+                raise ValueError(msg.format(header.get('version')))
 
-        for episode in result:
-            title = utils.encode(episode[0])
-            season = episode[1]
-            number = episode[2]
-            count = episode[3]
-            type_ = utils.encode(episode[4])
-            eps.append(Episode(title=title, number=number, season=season,
-                               count=count, type=type_))
+            with self.connection as conn:
+                for line in snapshot:
+                    show = json.loads(line.decode('utf-8'))
+                    title = show['title']
 
-        return eps
+                    sid, _ = self._store_show(conn, title, show['episodes'],
+                                              show['time'])
+                    conn.executemany("INSERT OR REPLACE INTO aliases VALUES (?, ?)",
+                                     ((alias, sid) for alias in show.get('aliases', [])))
+                    shows += 1
+
+        self.memory_cache.clear()
+        self.enforce_budget()
+
+        logging.info("Imported {} shows from {}".format(shows, path))
+        return shows
 
     def recreate_cache(self):
         """
@@ -137,12 +764,151 @@ class Cache(object):
         """
         with self.connection as conn:
             conn.executescript(delete_database)
-            conn.executescript(create_database)
+
+        self.memory_cache.clear()
+        self.migrate()
+
+
+class _ThreadConnection(object):
+    """ Holds a thread's connection so the cache notices when it's dropped """
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class MemoryCache(object):
+    """
+    A bounded, thread safe, least recently used mapping that sits in front of
+    the database so repeated lookups don't have to rebuild the episodes
+    """
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, valid=None):
+        """
+        Returns the entry for the key or None.  If the callable valid is
+        passed and it rejects the entry it is dropped and counted as a miss
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is None or (valid and not valid(entry)):
+                self.misses += 1
+                return None
+
+            # Re-insert to mark the entry as the most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """ Store the entry, evicting the least recently used if necessary """
+        if self.size <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """ Drop the entry for the key if it is present """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_if(self, predicate):
+        """ Drop every entry the predicate returns true for """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if predicate(entry):
+                    del self._entries[key]
+
+    def clear(self):
+        """ Drop every entry and reset the counters """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def _snapshot_line(record):
+    """ Serialize a snapshot record as a line of utf-8 encoded json """
+    return json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _episode_rows(episodes):
+    """ Convert episodes into the row tuples stored in the episodes table """
+    return ((e.title, e.season, e.number, e.count, e.type) for e in episodes)
+
+
+def _build_episodes(rows):
+    """ Create new episodes from the rows stored in the episodes table """
+    return [Episode(title=utils.encode(title), number=number, season=season,
+                    count=count, type=utils.encode(type_))
+            for title, season, number, count, type_ in rows]
+
+
+def _digest_key(names):
+    """ The digests a checkpoint was saved for, independent of their order """
+    return ','.join(sorted(names))
 
 
-create_database = """
-PRAGMA foreign_keys = ON;
+def _validate_show(showTitle, episodes, specials):
+    """
+    Raises a ValueError if the show information can't be stored in the cache
+    """
+    if not showTitle:
+        raise ValueError("Empty show title passed to add_show")
 
+    if not episodes and not specials:
+        raise ValueError("Empty specials/episode list passed")
+
+    if not isinstance(episodes, list) or not isinstance(specials, list):
+        raise ValueError("Episode/specials must be in a list")
+
+
+snapshot_format = 'eplist-snapshot'
+snapshot_version = 1
+
+## The show a title belongs to, a title may be both a show's own and an alias
+## of another show in which case the show stored under the title wins
+find_show = """
+SELECT sid, title, time FROM (
+    SELECT sid, title, time, 0 AS alias FROM shows WHERE title=?
+    UNION ALL
+    SELECT s.sid, s.title, s.time, 1 AS alias
+    FROM aliases AS a INNER JOIN shows AS s ON s.sid=a.sid
+    WHERE a.alias=?)
+ORDER BY alias LIMIT 1
+"""
+
+## The episode rows of a show in the order they were stored
+find_episodes = """
+SELECT title, season, number, count, type FROM episodes WHERE sid=? ORDER BY eid
+"""
+
+create_schema_version = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER NOT NULL
+);
+"""
+
+## Each entry upgrades the schema by one version, append new migrations to
+## the end of the list and never modify the ones that have already shipped.
+## Version 1 is the original schema so it is safe to run on databases that
+## were created before the schema was versioned.
+migrations = [
+"""
 CREATE TABLE IF NOT EXISTS shows (
     sid INTEGER PRIMARY KEY,
     title TEXT NOT NULL,
@@ -158,23 +924,84 @@ CREATE TABLE IF NOT EXISTS episodes (
     count INTEGER NOT NULL,
     type TEXT NOT NULL
 );
+""",
+
+## Covering indexes so title lookups and episode fetches don't scan the tables
+"""
+CREATE INDEX IF NOT EXISTS shows_title_idx ON shows (title, time);
+
+CREATE INDEX IF NOT EXISTS episodes_sid_idx
+    ON episodes (sid, title, season, number, count, type);
+""",
+
+## Track when each show was last read so the cache can evict the least
+## recently used shows once it grows past its budget
+"""
+ALTER TABLE shows ADD COLUMN last_access TIMESTAMP;
+
+UPDATE shows SET last_access=time;
+
+CREATE INDEX IF NOT EXISTS shows_access_idx ON shows (last_access);
+""",
+
+## Titles that couldn't be located online, so misses aren't polled repeatedly
+"""
+CREATE TABLE IF NOT EXISTS not_found (
+    title TEXT PRIMARY KEY,
+    time TIMESTAMP NOT NULL
+);
+""",
+
+## Alternate titles for cached shows, removed along with the show they map to
+"""
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    sid INTEGER NOT NULL REFERENCES shows(sid) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS aliases_sid_idx ON aliases (sid);
+""",
+
+## Checksums of files on disk, a file is only hashed again once its size or
+## modification time changes
+"""
+CREATE TABLE IF NOT EXISTS checksums (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    crc32 INTEGER NOT NULL,
+    PRIMARY KEY (device, inode)
+);
+""",
+
+## MD5 and ED2K digests alongside the CRC32 of each file
+"""
+ALTER TABLE checksums ADD COLUMN md5 TEXT;
+ALTER TABLE checksums ADD COLUMN ed2k TEXT;
+""",
 
--- CREATE TABLE IF NOT EXISTS backup_info (
---     bid INTEGER PRIMARY KEY,
---     path STRING NOT NULL,
---     show STRING NOT NULL,
---     old_name STRING NOT NULL,
---     new_name STRING NOT NULL
---     );
-
--- CREATE TABLE IF NOT EXISTS access_times (
---     site_id INTEGER PRIMARY KEY,
---     site STRING NOT NULL,
---     last_access TIMESTAMP NOT NULL
---     )
+## Progress saved part way through hashing large files
 """
+CREATE TABLE IF NOT EXISTS hash_checkpoints (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    digests TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (device, inode)
+);
+""",
+]
 
 delete_database = """
+DROP TABLE IF EXISTS not_found;
+DROP TABLE IF EXISTS aliases;
+DROP TABLE IF EXISTS hash_checkpoints;
+DROP TABLE IF EXISTS checksums;
 DROP TABLE IF EXISTS episodes;
 DROP TABLE IF EXISTS shows;
+DROP TABLE IF EXISTS schema_version;
 """
@@ -81,7 +81,7 @@ regexList = [
 regexList = [r.format(**regex_vars) for r in regexList]
 regexList = [re.compile(regex) for regex in regexList]
 
-checksum_regex = re.compile(r'[\[\(](?P<checksum>[a-f0-9]{8})[\]\)]', re.I)
+checksum_regex = re.compile(r'[\[\(](?P<checksum>[a-f0-9]{32}|[a-f0-9]{8})[\]\)]', re.I)
 
 remove_junk_regex = re.compile(r'[\[\(].*?[\]\]]', re.I)
 
@@ -102,3 +102,98 @@ class AttributeDict(dict):
 
     def __setattr__(self, name, value):
         self[name] = value
+
+
+class Record(object):
+    """
+    A compact alternative to AttributeDict for objects that are created in
+    bulk.  Subclasses declare their fields in __slots__ so they aren't stored
+    in a per instance dictionary, the dictionary style access the rest of the
+    program relies on is still supported.  Adding '__dict__' to the slots
+    allows fields that weren't declared.
+    """
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            setattr(self, key, value)
+
+    def keys(self):
+        """ The names of the fields that have been set """
+        names, _, extras = _record_fields(type(self))
+        keys = [name for name in names if hasattr(self, name)]
+
+        if extras:
+            keys.extend(self._extras())
+
+        return keys
+
+    def _extras(self):
+        """
+        The fields that weren't declared.  Reading __dict__ creates it, an
+        empty one is dropped again so the record stays compact
+        """
+        fields = object.__getattribute__(self, '__dict__')
+        if not fields:
+            del self.__dict__
+        return fields
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self else default
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        _, declared, extras = _record_fields(type(self))
+
+        if key in declared:
+            return hasattr(self, key)
+
+        return extras and key in self._extras()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        fields = ', '.join('{}={!r}'.format(k, v) for k, v in self.items())
+        return '{}({})'.format(type(self).__name__, fields)
+
+
+_fields = {}
+
+
+def _record_fields(cls):
+    """
+    Returns the names of the fields the record class declares, in order and
+    as a set, and whether it accepts undeclared fields.  Worked out once per
+    class
+    """
+    try:
+        return _fields[cls]
+    except KeyError:
+        pass
+
+    names = []
+    extras = False
+
+    for klass in cls.__mro__:
+        for name in klass.__dict__.get('__slots__', ()):
+            if name == '__dict__':
+                extras = True
+            elif name != '__weakref__':
+                names.append(name)
+
+    fields = _fields[cls] = (tuple(names), frozenset(names), extras)
+    return fields
@@ -5,65 +5,124 @@ Module contains logic and containers for dealing with shows/episodes/specials
 from __future__ import unicode_literals, absolute_import
 
 import re
-import zlib
 import string
 import logging
 
+from functools import partial
 from collections import defaultdict
 
 from eplist import utils
+from eplist import hashing
 
 from eplist.settings import Settings
-from eplist.constants import AttributeDict
+from eplist.constants import Record
 
 
-class Episode(AttributeDict):
+class Episode(Record):
     """
     A simple class to organize the episodes/specials
     """
+    __slots__ = ('title', 'season', 'number', 'count', 'type', 'file',
+                 'is_special', 'series', '__dict__')
+
     def __init__(self, **kwargs):
         """
         A container for an episode's information collected from the web
         """
         #title, number, season=1, count=-1,
-        super(Episode, self).__init__(kwargs)
-        self.title = utils.encode(kwargs['title'])
-        self.season = int(kwargs.get('season', 1))
-        self.number = int(kwargs['number'])
-        self.count = int(kwargs.get('count', '-1'))
-        self.type = kwargs.get('type', 'Episode')
-        self.file = kwargs.get('file', None)
+        self.title = utils.encode(kwargs.pop('title'))
+        self.season = int(kwargs.pop('season', 1))
+        self.number = int(kwargs.pop('number'))
+        self.count = int(kwargs.pop('count', '-1'))
+        self.type = kwargs.pop('type', 'Episode')
+        self.file = kwargs.pop('file', None)
+        self.series = kwargs.pop('series', None)
         self.is_special = (self.type.lower() != "episode")
+        super(Episode, self).__init__(kwargs)
 
 
-class EpisodeFile(AttributeDict):
+class EpisodeFile(Record):
     """
     Represents a TV episode file on disk.  Used for renaming purposes
     """
+    __slots__ = ('path', 'name', 'ext', 'new_name', 'cache', 'checksum',
+                 'encoding', 'series', 'title', 'season', 'episode',
+                 'episode_number', 'special_type', 'special_number', 'junk',
+                 '__dict__')
+
     @property
     def is_special(self):
         return 'special_number' in self
 
-    def crc32(self):
+    def crc32(self, force=False):
+        """
+        Calculate the CRC32 checksum for a file.  If the file has a
+        cache the result is stored there and reused until the file changes,
+        pass force to ignore the stored result
+        """
+        return int(self.digests(['crc32'], force)['crc32'], base=16)
+
+    def digests(self, names=hashing.algorithms, force=False):
         """
-        Calculate the CRC32 checksum for a file... slowly
+        Returns a dictionary of hex digests for each of the algorithms named,
+        any that aren't stored in the cache are calculated together in a
+        single pass over the file.  The CRC32 is always calculated alongside
+        them since it is needed to store the results.  With a cache the
+        progress is checkpointed so an interrupted run can resume.
         """
-        logging.info("calculating CRC for {}".format(self.name))
-        with open(self.path, 'rb') as ep_file:
-            checksum = 0
-            for line in ep_file:
-                checksum = zlib.crc32(line, checksum)
+        cache = self.get('cache')
+        identity = utils.file_identity(self.path) if cache else None
+
+        stored = {}
+        if identity and not force:
+            stored = cache.get_digests(identity)
+
+        missing = [name for name in names if name not in stored]
+
+        if missing:
+            if identity and 'crc32' not in missing:
+                missing.append('crc32')
+
+            logging.info("calculating {} for {}".format(
+                         ', '.join(missing).upper(), self.name))
+
+            resume = checkpoint = None
+            if identity:
+                if not force:
+                    resume = cache.get_checkpoint(identity, missing)
+                checkpoint = partial(cache.store_checkpoint, identity, missing)
+
+            if resume:
+                logging.info("Resuming {} from byte {}".format(self.name, resume[0]))
 
-        return checksum & 0xFFFFFFFF
+            hasher = hashing.FileHasher()
+            stored.update(hasher.digests(self.path, missing, resume, checkpoint))
 
-    def verify_integrity(self):
+            if identity:
+                cache.store_digests(identity, stored)
+                cache.clear_checkpoint(identity)
+        else:
+            logging.info("Using the stored digests for {}".format(self.name))
+
+        return dict((name, stored[name]) for name in names)
+
+    def verify_integrity(self, force=False, digest=None):
         """
-        Compares the checksum in the filename to the calculated one
+        Compares the checksum in the filename to the calculated one.  An eight
+        digit checksum is always a CRC32, longer ones use the digest given or
+        the verify_digest setting
         """
-        if self.checksum:
-            if self.crc32() == int(self.checksum, base=16):
-                return True
-        return False
+        if not self.checksum:
+            return False
+
+        if len(self.checksum) == 8:
+            digest = 'crc32'
+        elif not digest:
+            digest = Settings.verify_digest
+
+        calculated = self.digests([digest], force)[digest]
+
+        return calculated.lower() == self.checksum.lower()
 
 
 class Show(object):
@@ -76,8 +135,8 @@ class Show(object):
         self.proper_title = utils.prepare_title(seriesTitle.lower())
         self.episodes = []
         self.specials = []
-        self._episodes_by_season = defaultdict(list)
         self.formatter = None
+        self._index([], [])
 
         if episodes:
             self.add_episodes(episodes)
@@ -91,9 +150,6 @@ class Show(object):
         if not eplist:
             return
 
-        self.episodes = []
-        self.specials = []
-
         eps, spc = [], []
 
         for e in eplist:
@@ -104,10 +160,35 @@ class Show(object):
                 spc.append(e)
             else:
                 eps.append(e)
-                self._episodes_by_season[e.season].append(e)
 
-        self.episodes = sorted(eps, key=lambda x: x.count)
-        self.specials = sorted(spc, key=lambda x: x.number)
+        self._index(sorted(eps, key=lambda x: x.count),
+                    sorted(spc, key=lambda x: x.number))
+
+    def _index(self, episodes, specials):
+        """
+        Store the sorted episodes and specials, building the lookup tables
+        and aggregates in the same pass so none of them need to be derived
+        again when they are accessed
+        """
+        self.episodes = episodes
+        self.specials = specials
+
+        self._episodes_by_season = defaultdict(list)
+        self._episodes_by_number = {}
+        self._episodes_by_count = {}
+        self._specials_by_number = {}
+        self._max_episode = self._max_season = self._max_special = 0
+
+        for e in episodes:
+            self._episodes_by_season[e.season].append(e)
+            self._episodes_by_number.setdefault((e.season, e.number), e)
+            self._episodes_by_count.setdefault(e.count, e)
+            self._max_episode = max(self._max_episode, e.number)
+            self._max_season = max(self._max_season, e.season)
+
+        for e in specials:
+            self._specials_by_number.setdefault(e.number, e)
+            self._max_special = max(self._max_special, e.number)
 
     @property
     def num_episodes(self):
@@ -117,17 +198,17 @@ class Show(object):
     @property
     def max_episode(self):
         """ Returns the highest episode number in the show """
-        return max(x.number for x in self.episodes) if self.episodes else 0
+        return self._max_episode
 
     @property
     def num_seasons(self):
         """ The total number of seasons the show has """
-        return self.episodes[-1].season
+        return self._max_season
 
     @property
     def num_specials(self):
         """ Total count of special episodes """
-        return self.specials[-1].number
+        return self._max_special
 
     @property
     def show_title(self):
@@ -147,7 +228,7 @@ class Show(object):
         """
         Returns a list of episodes within the season or an empty list
         """
-        return self._episodes_by_season[season]
+        return self._episodes_by_season.get(season, [])
 
     def get_episode(self, episode, season):
         """
@@ -156,18 +237,29 @@ class Show(object):
         if episode < 0 or episode > self.num_episodes:
             return None
 
-        # Adjust by one since episodes start count at 1 not 0
-        episode -= 1
+        if season > 1:
+            found = self._episodes_by_number.get((season, episode))
+            if found:
+                return found
 
-        season_list = self._episodes_by_season[season]
+            # Some sources keep counting the episode numbers across seasons
+            season_list = self._episodes_by_season.get(season, [])
+            if 0 < episode <= len(season_list):
+                return season_list[episode - 1]
 
-        if season_list and season > 1 and len(season_list) > episode:
-            return season_list[episode]
-        else:
-            return self.episodes[episode]
+        found = self._episodes_by_count.get(episode)
+        if found:
+            return found
+
+        # Adjust by one since episodes start count at 1 not 0
+        return self.episodes[episode - 1]
 
     def get_special(self, special_number):
         """ Returns the specified special or None """
+        found = self._specials_by_number.get(special_number)
+        if found:
+            return found
+
         if 0 < special_number < len(self.specials) + 1:
             return self.specials[special_number - 1]
         return None
@@ -205,6 +297,7 @@ class EpisodeFormatter(object):
         self.series_name_tags = Settings.tags['series_name_tags']
 
         self.check_for_duplicate_tokens()
+        self._compile()
 
     @property
     def format_string(self):
@@ -221,6 +314,7 @@ class EpisodeFormatter(object):
         if fmt:
             self._format_string = utils.encode(fmt)
             self.tokens = self.tag_regex.split(fmt)
+            self._compile()
         else:
             raise AttributeError("Empty format string set")
 
@@ -246,24 +340,66 @@ class EpisodeFormatter(object):
         """
         Displays the episode according to the users format
         """
-        args = []
+        return self._render(episode, self._context())
+
+    def display_many(self, episodes):
+        """
+        A generator that displays each of the episodes according to the users
+        format.  The show level information is gathered once for the whole
+        batch rather than once per episode, wrap it in list() if a list is
+        needed.
+        """
+        context = self._context()
+        for episode in episodes:
+            yield self._render(episode, context)
+
+    def _render(self, episode, context):
+        """ Run the render plan for the episode """
+        return utils.encode(''.join([part(episode, context) for part in self._plan])).strip()
+
+    def _context(self):
+        """
+        The show level information the tags need, the padding widths are
+        derived from the largest number of each kind in the show.  Digests
+        calculated while rendering are kept so a file is only hashed once
+        """
+        show = self.show
+        return {
+            'series': show.title,
+            'season_pad': len(str(show.num_seasons)),
+            'episode_pad': len(str(show.max_episode)),
+            'count_pad': len(str(show.num_episodes)),
+            'special_pad': len(str(show.num_specials)),
+            'digests': {},
+        }
+
+    def _compile(self):
+        """
+        Resolve the tokens of the format string into a render plan, a list of
+        functions that each take an episode and the show context and return
+        their piece of the output, so displaying an episode doesn't need to
+        parse anything
+        """
+        plan = []
+        self._digests = []
         escaped_token = "\{}".format(Settings.tag_start)
         for token in self.tokens:
             if escaped_token in token:
-                args.append(token.replace(escaped_token, Settings.tag_start))
+                plan.append(_literal(token.replace(escaped_token, Settings.tag_start)))
             elif self.tag_regex.match(token):
                 #If it's a tag try to resolve it
                 token = self.strip_whitespace_regex.sub("", token)
-                args.append(self._parse(episode, token[1:-1]))
-            else:
-                args.append(token)
+                plan.append(self._compile_tag(token[1:-1]))
+            elif token:
+                plan.append(_literal(token))
 
-        return utils.encode(''.join(args)).strip()
+        self._plan = plan
 
     def _parse_modifiers(self, tag):
         """ Handle tag modifiers such as number padding and caps """
         modifier_settings = {'upper': False, 'lower': False,
-                                  'pad': False, 'proper': False}
+                                  'pad': False, 'proper': False,
+                                  'digest': 'crc32'}
 
         if ':' in tag:
             res = re.split(':', tag)
@@ -281,50 +417,50 @@ class EpisodeFormatter(object):
         elif 'proper' in modifiers:
             modifier_settings['proper'] = True
 
+        for digest in hashing.algorithms:
+            if digest in modifiers:
+                modifier_settings['digest'] = digest
+
         return tag, modifier_settings
 
-    def _parse(self, episode, tag):
+    def _compile_tag(self, tag):
         """
-        Tokenize and substitute tags for their values using an episode
+        Returns the function that substitutes the tag, with its modifiers
+        applied, for its value using an episode
         """
-
         tag, mods = self._parse_modifiers(tag.lower())
+        modify = _string_modifier(mods)
 
         if tag in self.episode_number_tags:
-            return self._handle_episode_number(episode, mods)
+            return partial(self._handle_episode_number, mods=mods)
 
         elif tag in self.type_tags:
-            return self._handle_string(episode.type, mods)
+            return lambda episode, context: modify(episode.type)
 
         elif tag in self.season_number_tags:
-            return self._handle_season(episode, mods)
+            return partial(self._handle_season, mods=mods)
 
         elif tag in self.episode_count_tags:
-            return self._handle_episode_counter(episode, mods)
+            return partial(self._handle_episode_counter, mods=mods)
 
         elif tag in self.episode_name_tags:
-            return self._handle_string(episode.title, mods)
+            return lambda episode, context: modify(episode.title)
 
         elif tag in self.series_name_tags:
-            return self._handle_string(self.show.title, mods)
+            return lambda episode, context: modify(context['series'])
 
         elif tag in self.hash_tags:
-            return self._handle_hash(episode, mods)
+            if mods['digest'] not in self._digests:
+                self._digests.append(mods['digest'])
+            return partial(self._handle_hash, mods=mods)
 
         else:
             # If it reaches this case it's most likely an invalid tag
-            return Settings.tag_start + tag + Settings.tag_end
+            return _literal(Settings.tag_start + tag + Settings.tag_end)
 
     def _handle_string(self, string_, mods):
         """ Applies modifiers to strings in the format """
-        if mods['lower']:
-            return string_.lower()
-        elif mods['upper']:
-            return string_.upper()
-        elif mods['proper']:
-            return string.capwords(string_)
-        else:
-            return string_
+        return _string_modifier(mods)(string_)
 
     def _handle_number(self, number, pad_length, mods):
         """ Applies padding to numbers then converts them to strings """
@@ -333,54 +469,70 @@ class EpisodeFormatter(object):
         else:
             return str(number)
 
-    def _handle_season(self, episode, mods):
+    def _handle_season(self, episode, context, mods):
         """ Applies padding to season number """
         if episode.is_special:
             # Going on the basis that specials don't have seasons
             return ""
 
-        pad = len(str(self.show.num_seasons))
-        return self._handle_number(episode.season, pad, mods)
+        return self._handle_number(episode.season, context['season_pad'], mods)
 
-    def _handle_episode_number(self, episode, mods):
+    def _handle_episode_number(self, episode, context, mods):
         """ Applies modifiers to the episode number """
         number = episode.number
         if not episode.is_special:
-            pad = len(str(self.show.max_episode))
+            pad = context['episode_pad']
         else:
-            pad = len(str(self.show.num_specials))
+            pad = context['special_pad']
 
         return self._handle_number(number, pad, mods)
 
-    def _handle_episode_counter(self, episode, mods):
+    def _handle_episode_counter(self, episode, context, mods):
         """ Applies modifiers to the episodes overall count """
         number = episode.count
         if not episode.is_special:
-            pad = len(str(self.show.num_episodes))
+            pad = context['count_pad']
         else:
-            pad = len(str(self.show.num_specials))
+            pad = context['special_pad']
 
         return self._handle_number(number, pad, mods)
 
-    def _handle_hash(self, episode, mods):
+    def _handle_hash(self, episode, context, mods):
         """
-        Applies string modifiers to the episodes checksum.  Calculates it
-        if it is necessary.
+        Applies string modifiers to the episodes checksum, the digest
+        modifier picks which one.  Calculates it if it is necessary, every
+        digest used in the format is calculated at the same time.
         """
+        digest = mods['digest']
+
         if not episode.file:
-            return "00000000"
+            return "0" * (8 if digest == 'crc32' else 32)
 
-        if episode.file.checksum:
+        if digest == 'crc32' and len(episode.file.checksum or '') == 8:
             checksum = episode.file.checksum
         else:
-            # To remove the 0x from the hex string
-            checksum = hex(episode.file.crc32())
+            digests = context['digests'].get(episode.file.path)
+            if digests is None:
+                digests = episode.file.digests(self._digests)
+                context['digests'][episode.file.path] = digests
+
+            checksum = digests[digest]
+
+        return self._handle_string(checksum, mods)
+
 
-        if checksum.startswith('0x'):
-            checksum = checksum[2:]
+def _literal(text):
+    """ A render plan entry for text that is copied into the output as is """
+    return lambda episode, context: text
 
-        if checksum.endswith('L'):
-            checksum = checksum[:-1]
 
-        ## If the checksum is less than 8 digits, pad to to 8
-        return self._handle_string(checksum.zfill(8), mods)
+def _string_modifier(mods):
+    """ Returns the function that applies the string modifiers """
+    if mods['lower']:
+        return lambda string_: string_.lower()
+    elif mods['upper']:
+        return lambda string_: string_.upper()
+    elif mods['proper']:
+        return string.capwords
+    else:
+        return lambda string_: string_
@@ -168,8 +168,7 @@ class Form(QtGui.QWidget):
             return
 
         self.episode_list.clear()
-        for ep in self.episodes:
-            self.episode_list.addItem(self.show.formatter.display(ep))
+        self.episode_list.addItems(list(self.show.formatter.display_many(self.episodes)))
 
     def filterType(self, text):
         if 'all' in text.lower():
@@ -238,7 +237,7 @@ class Form(QtGui.QWidget):
             InfoMessage(self, "Rename Files", "No Show Information Retrieved")
             return
 
-        files = utils.prepare_filenames(self.renameDir, self.show)
+        files = utils.prepare_filenames(self.renameDir, self.show, cache)
         dialog = RenameDialog(files, self)
         dialog.finished.connect(self.updateDirectoryListing)
         dialog.exec_()
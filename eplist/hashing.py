@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Provides the checksum engine used to hash episode files.  Files are read in
+fixed size blocks into a single reused buffer, or mapped into memory, and the
+blocks are handed to the hash functions without being copied.  Every
+digest that is asked for is calculated from the same pass over the file.
+
+The progress through large files can be checkpointed so an interrupted run
+carries on where it stopped.  This is only possible when the state of every
+digest can be saved, CRC32 always can and ED2K can at the end of each chunk,
+the state of hashlib's MD5 can't be saved so hashing it always starts over.
+"""
+from __future__ import unicode_literals, division
+
+import io
+import os
+import time
+import mmap
+import zlib
+import struct
+import hashlib
+import logging
+
+from binascii import hexlify, unhexlify
+
+from eplist.settings import Settings
+
+if Settings.py3k:
+    _view = lambda data, offset, size: memoryview(data)[offset:offset + size]
+else:
+    _view = buffer
+
+## The digests a file can be hashed with
+algorithms = ('crc32', 'md5', 'ed2k')
+
+## ED2K hashes the file in chunks of this size
+ed2k_chunk_size = 9728000
+
+
+class FileHasher(object):
+    """
+    Calculates checksums of files and keeps track of how much data it has
+    read and how long that took
+    """
+    def __init__(self, block_size=None, use_mmap=None, checkpoint_size=None):
+        self.block_size = block_size or Settings.hash_block_size
+        self.use_mmap = Settings.hash_use_mmap if use_mmap is None else use_mmap
+
+        if checkpoint_size is None:
+            checkpoint_size = Settings.hash_checkpoint_size
+        self.checkpoint_size = checkpoint_size
+
+        self.bytes_read = 0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        """ The average speed everything has been hashed at in MB/s """
+        if not self.elapsed:
+            return 0.0
+
+        return self.bytes_read / self.elapsed / 2 ** 20
+
+    def crc32(self, path):
+        """ Returns the CRC32 checksum of the file """
+        return int(self.digests(path, ['crc32'])['crc32'], base=16)
+
+    def digests(self, path, names=algorithms, resume=None, checkpoint=None):
+        """
+        Returns a dictionary of the hex digests of the file for each of the
+        algorithms named, the file is only read once.  resume is an
+        (offset, state) tuple saved by an earlier run to carry on from and
+        checkpoint is called with (offset, state) every checkpoint_size bytes
+        """
+        offset, state = resume or (0, {})
+        if set(state) != set(names):
+            offset, state = 0, {}
+
+        hashers = dict((name, new(name, state.get(name))) for name in names)
+
+        ## ED2K state can only be saved at the end of a chunk so make sure
+        ## the blocks line up with them
+        boundary = ed2k_chunk_size if 'ed2k' in hashers else None
+        last_checkpoint = offset
+
+        start = time.time()
+        size = 0
+
+        with io.open(path, 'rb', buffering=0) as file_:
+            for block in self._blocks(file_, offset, boundary):
+                for hasher in hashers.values():
+                    hasher.update(block)
+                size += len(block)
+                offset += len(block)
+
+                if not checkpoint or not self.checkpoint_size:
+                    continue
+
+                if offset - last_checkpoint >= self.checkpoint_size:
+                    state = _state(hashers)
+                    if state is not None:
+                        checkpoint(offset, state)
+                        last_checkpoint = offset
+
+        elapsed = time.time() - start
+        self.bytes_read += size
+        self.elapsed += elapsed
+
+        if elapsed:
+            msg = "Hashed {} ({:.1f} MB) at {:.1f} MB/s"
+            logging.info(msg.format(path, size / 2 ** 20, size / elapsed / 2 ** 20))
+
+        return dict((name, h.hexdigest()) for name, h in hashers.items())
+
+    def _blocks(self, file_, offset=0, boundary=None):
+        """
+        Yields the contents of the file block by block starting from offset,
+        no block crosses a multiple of boundary
+        """
+        size = os.fstat(file_.fileno()).st_size
+
+        def lengths(offset):
+            while offset < size:
+                length = min(self.block_size, size - offset)
+                if boundary:
+                    length = min(length, boundary - offset % boundary)
+                yield offset, length
+                offset += length
+
+        # Empty files can't be mapped.  The mapping isn't closed explicitly
+        # since the caller may still hold a view of it, it is released along
+        # with the last block
+        if self.use_mmap and size:
+            mapped = mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+            for start, length in lengths(offset):
+                yield _view(mapped, start, length)
+            return
+
+        file_.seek(offset)
+        buf = bytearray(self.block_size)
+        view = memoryview(buf)
+
+        for start, length in lengths(offset):
+            # A read can come back short, on network shares especially, so
+            # keep reading until the block is full or the file ends
+            count = 0
+            while count < length:
+                read = file_.readinto(view[count:length])
+                if not read:
+                    break
+                count += read
+
+            if count:
+                yield _view(buf, 0, count)
+
+            if count < length:
+                break
+
+
+def new(name, state=None):
+    """
+    Returns a new hash object for one of the algorithms, optionally carrying
+    on from a saved state
+    """
+    if name == 'crc32':
+        return CRC32(state)
+    elif name == 'md5' and state is None:
+        return hashlib.md5()
+    elif name == 'ed2k':
+        return ED2K(state)
+
+    raise ValueError("Unknown digest: {}".format(name))
+
+
+def _state(hashers):
+    """
+    Returns the saved state of every hash object, or None if any of them
+    can't be saved at this point
+    """
+    state = {}
+    for name, hasher in hashers.items():
+        saved = hasher.state() if hasattr(hasher, 'state') else None
+        if saved is None:
+            return None
+        state[name] = saved
+
+    return state
+
+
+class CRC32(object):
+    """ Wraps zlib.crc32 in the same interface as the hashlib objects """
+    def __init__(self, state=None):
+        self.value = state or 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def state(self):
+        return self.value & 0xFFFFFFFF
+
+    def hexdigest(self):
+        return "{:08x}".format(self.value & 0xFFFFFFFF)
+
+
+class ED2K(object):
+    """
+    The eDonkey hash used by AniDB to identify files.  The data is split into
+    9500 KiB chunks which are hashed with MD4, the final hash is the MD4 of
+    the chunk hashes or the hash of the only chunk if there is just one.  Files
+    that are an exact multiple of the chunk size don't get an extra empty
+    chunk hashed onto the end.  The state is the list of finished chunk
+    hashes so it can only be saved between chunks.
+    """
+    def __init__(self, state=None):
+        self._hashes = [unhexlify(h) for h in state or []]
+        self._chunk = md4()
+        self._filled = 0
+
+    def state(self):
+        if self._filled:
+            return None
+
+        return [hexlify(h).decode('ascii') for h in self._hashes]
+
+    def update(self, data):
+        offset = 0
+        while offset < len(data):
+            size = min(len(data) - offset, ed2k_chunk_size - self._filled)
+            self._chunk.update(_view(data, offset, size))
+            self._filled += size
+            offset += size
+
+            if self._filled == ed2k_chunk_size:
+                self._hashes.append(self._chunk.digest())
+                self._chunk = md4()
+                self._filled = 0
+
+    def hexdigest(self):
+        hashes = list(self._hashes)
+        if self._filled or not hashes:
+            hashes.append(self._chunk.digest())
+
+        if len(hashes) == 1:
+            return hexlify(hashes[0]).decode('ascii')
+
+        combined = md4()
+        combined.update(b''.join(hashes))
+        return combined.hexdigest()
+
+
+class MD4(object):
+    """
+    A pure python MD4 (RFC 1320) used when hashlib is built without it,
+    newer versions of OpenSSL no longer provide it.  It is much slower than
+    the OpenSSL version.
+    """
+    _mask = 0xFFFFFFFF
+
+    _rounds = (
+        (lambda x, y, z: (x & y) | (~x & z), 0,
+         range(16), (3, 7, 11, 19)),
+        (lambda x, y, z: (x & y) | (x & z) | (y & z), 0x5A827999,
+         (0, 4, 8, 12, 1, 5, 9, 13, 2, 6, 10, 14, 3, 7, 11, 15), (3, 5, 9, 13)),
+        (lambda x, y, z: x ^ y ^ z, 0x6ED9EBA1,
+         (0, 8, 4, 12, 2, 10, 6, 14, 1, 9, 5, 13, 3, 11, 7, 15), (3, 9, 11, 15)),
+    )
+
+    def __init__(self):
+        self._state = (0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476)
+        self._buffer = b''
+        self._length = 0
+
+    def update(self, data):
+        data = self._buffer + bytes(data)
+        self._length += len(data) - len(self._buffer)
+
+        end = len(data) - len(data) % 64
+        for offset in range(0, end, 64):
+            self._state = self._compress(self._state, data[offset:offset + 64])
+
+        self._buffer = data[end:]
+
+    def digest(self):
+        padding = b'\x80' + b'\x00' * ((55 - self._length) % 64)
+        tail = self._buffer + padding + struct.pack('<Q', self._length * 8)
+
+        state = self._state
+        for offset in range(0, len(tail), 64):
+            state = self._compress(state, tail[offset:offset + 64])
+
+        return struct.pack('<4I', *state)
+
+    def hexdigest(self):
+        return hexlify(self.digest()).decode('ascii')
+
+    @classmethod
+    def _compress(cls, state, block):
+        mask = cls._mask
+        words = struct.unpack('<16I', block)
+        a, b, c, d = state
+
+        for func, constant, order, shifts in cls._rounds:
+            for i, k in enumerate(order):
+                a = (a + func(b, c, d) + words[k] + constant) & mask
+                shift = shifts[i % 4]
+                a = ((a << shift) | (a >> (32 - shift))) & mask
+                a, b, c, d = d, a, b, c
+
+        return tuple((x + y) & mask for x, y in zip(state, (a, b, c, d)))
+
+
+try:
+    hashlib.new('md4')
+    md4 = lambda: hashlib.new('md4')
+    native_md4 = True
+except ValueError:
+    md4 = MD4
+    native_md4 = False
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Provides an on disk cache of web pages so pages that haven't changed don't
+have to be downloaded again.  Responses that carry an ETag or Last-Modified
+header are saved in the resources folder, the next request for the same url
+sends them back as If-None-Match and If-Modified-Since and a 304 Not
+Modified response is answered with the saved copy.
+
+Pages that haven't been used for a while can be removed with clear, the
+time a page was last used is the modification time of its headers file.
+"""
+from __future__ import unicode_literals
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+
+import requests
+
+from requests.structures import CaseInsensitiveDict
+
+## Headers saved along with the page
+saved_headers = ('ETag', 'Last-Modified', 'Content-Type')
+
+
+class HTTPCache(object):
+    """
+    Stores the body of each cacheable response in the directory along with
+    the headers needed to revalidate it
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _paths(self, url):
+        """ The files the body and headers of the url are stored in """
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.body', base + '.json'
+
+    def _load_headers(self, url):
+        _, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'rb') as file_:
+                meta = json.loads(file_.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+
+        # Different urls could share a hash, make sure it's the right one
+        if meta.get('url') != url:
+            return None
+
+        return meta
+
+    def conditional_headers(self, url):
+        """
+        Returns the request headers that ask the server to only send the
+        page if it has changed since it was saved
+        """
+        meta = self._load_headers(url)
+        if not meta:
+            return {}
+
+        headers = {}
+        stored = meta['headers']
+        if 'ETag' in stored:
+            headers['If-None-Match'] = stored['ETag']
+        if 'Last-Modified' in stored:
+            headers['If-Modified-Since'] = stored['Last-Modified']
+
+        return headers
+
+    def store(self, url, resp):
+        """
+        Save a successful response if it can be revalidated later, returns
+        true if it was saved
+        """
+        headers = dict((h, resp.headers[h]) for h in saved_headers if h in resp.headers)
+
+        if 'ETag' not in headers and 'Last-Modified' not in headers:
+            return False
+
+        if 'no-store' in resp.headers.get('Cache-Control', '').lower():
+            return False
+
+        meta = {'url': url, 'headers': headers, 'encoding': resp.encoding}
+        body_path, meta_path = self._paths(url)
+
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+
+            _write(body_path, resp.content)
+            _write(meta_path, json.dumps(meta).encode('utf-8'))
+        except (IOError, OSError):
+            logging.exception("Unable to save {} to the http cache".format(url))
+            return False
+
+        return True
+
+    def load(self, url, not_modified=None):
+        """
+        Rebuild the saved response for the url, the headers from the 304
+        response passed are merged in and saved so the next request sends
+        the new validators.  Returns None if nothing was saved
+        """
+        meta = self._load_headers(url)
+        if not meta:
+            return None
+
+        body_path, _ = self._paths(url)
+        try:
+            with open(body_path, 'rb') as file_:
+                content = file_.read()
+        except (IOError, OSError):
+            return None
+
+        if not_modified is not None:
+            self._refresh_headers(url, meta, not_modified)
+
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.reason = 'OK'
+        resp.url = url
+        resp.encoding = meta.get('encoding')
+        resp.headers = CaseInsensitiveDict(meta['headers'])
+        resp._content = content
+        resp._content_consumed = True
+
+        if not_modified is not None:
+            resp.request = not_modified.request
+
+        return resp
+
+    def _refresh_headers(self, url, meta, not_modified):
+        """
+        Merge the headers of the 304 response into the saved ones and write
+        them back, which also marks the page as recently used
+        """
+        _, meta_path = self._paths(url)
+        headers = meta['headers']
+
+        for header in saved_headers:
+            if header in not_modified.headers:
+                headers[header] = not_modified.headers[header]
+
+        try:
+            _write(meta_path, json.dumps(meta).encode('utf-8'))
+        except (IOError, OSError):
+            logging.exception("Unable to update {} in the http cache".format(url))
+
+    def clear(self, max_age=None):
+        """
+        Remove the saved pages, if max_age in days is passed only the pages
+        that haven't been used for that long are removed.  Returns the number
+        of pages removed
+        """
+        if not os.path.exists(self.directory):
+            return 0
+
+        cutoff = time.time() - max_age * 86400 if max_age is not None else None
+        removed = 0
+
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+
+            meta_path = os.path.join(self.directory, name)
+            body_path = meta_path[:-len('.json')] + '.body'
+
+            try:
+                if cutoff is not None and os.path.getmtime(meta_path) > cutoff:
+                    continue
+
+                os.remove(meta_path)
+                if os.path.exists(body_path):
+                    os.remove(body_path)
+            except OSError:
+                logging.exception("Unable to remove {} from the http cache".format(name))
+                continue
+
+            removed += 1
+
+        # Bodies whose headers have gone missing can't be used any more
+        if cutoff is None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.body'):
+                    os.remove(os.path.join(self.directory, name))
+
+        return removed
+
+
+def _write(path, data):
+    """ Replace the file with the data without leaving it half written """
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as file_:
+            file_.write(data)
+
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp, path)
+    except Exception:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
@@ -69,7 +69,19 @@ def main():
         help="Undo the last rename operation")
 
     cmd.add_argument('--delete-cache', action="store_true",
-        help="Delete the cache file and create a new one")
+        help="Delete the cache file and create a new one, along with the downloaded pages")
+
+    cmd.add_argument('--compact-cache', action="store_true",
+        help="Prune expired shows and unused pages from the cache and shrink the cache file")
+
+    cmd.add_argument('--purge-not-found', action="store_true",
+        help="Forget the shows that were recently not found online")
+
+    cmd.add_argument('--export-cache', metavar="FILE",
+        help="Write a snapshot of the cache to FILE for seeding other machines")
+
+    cmd.add_argument('--import-cache', metavar="FILE",
+        help="Load the shows from a cache snapshot written by --export-cache")
 
     cmd.add_argument('--update-db', action="store_true",
         help="Update the AniDB titles file, limit to once a day due to size")
@@ -77,6 +89,15 @@ def main():
     cmd.add_argument('--verify', action="store_true",
         help="Verify the checksums in the filename if they are present")
 
+    cmd.add_argument('--rehash', action="store_true",
+        help="Recalculate checksums rather than using the ones stored in the cache")
+
+    cmd.add_argument('--digest', choices=('md5', 'ed2k'),
+        help="Digest to verify 32 digit checksums against, eight digit checksums are always crc32 (default=md5)")
+
+    cmd.add_argument('-j', '--jobs', type=int, metavar='N',
+        help="Number of files to verify at once (default=one per CPU)")
+
     cmd.add_argument('--filter', choices=['episodes', 'specials', 'both'],
         help="Filters episodes based on type (default=both)")
 
@@ -103,8 +124,32 @@ def main():
     cache = Cache(Settings.db_name)
     atexit.register(cache.close)
 
+    http_cache = utils.get_http_cache()
+
     if args.delete_cache:
         cache.recreate_cache()
+        if http_cache:
+            http_cache.clear()
+
+    if args.compact_cache:
+        removed = cache.compact()
+        print("Removed {} shows from the cache".format(removed))
+
+        if http_cache:
+            removed = http_cache.clear(Settings.http_cache_max_age)
+            print("Removed {} pages from the http cache".format(removed))
+
+    if args.purge_not_found:
+        removed = cache.purge_not_found()
+        print("Removed {} not found entries from the cache".format(removed))
+
+    if args.import_cache:
+        shows = cache.import_snapshot(args.import_cache)
+        print("Imported {} shows into the cache".format(shows))
+
+    if args.export_cache:
+        shows = cache.export_snapshot(args.export_cache)
+        print("Exported {} shows from the cache".format(shows))
 
     if Settings.title in ('-', '.', 'pwd'):
         # If a dash is entered use the current basename of the path
@@ -155,13 +200,13 @@ def main():
 
     ## Renaming functionality
     if rename:
-        do_rename(utils.prepare_filenames(Settings.path, show))
+        do_rename(utils.prepare_filenames(Settings.path, show, cache))
         sys.exit(0)
 
     if args.verify:
-        files = utils.clean_filenames(Settings.path)
+        files = utils.clean_filenames(Settings.path, cache)
 
-        verify_files(files)
+        verify_files(files, args.rehash, args.jobs, args.digest)
         sys.exit(1)
 
     if Settings.filter in ('both', 'episodes'):
@@ -233,12 +278,14 @@ def display_episodes(show, episodes, header=False):
         print ("-" * 30)
 
     curr_season = episodes[0].season
-    for eps in episodes:
+    lines = show.formatter.display_many(episodes)
+
+    for eps, line in zip(episodes, lines):
         if curr_season != eps.season and header:
             print ("\nSeason {0}".format(eps.season))
             print ("----------")
 
-        line = show.formatter.display(eps).encode(Settings.encoding, 'ignore')
+        line = line.encode(Settings.encoding, 'ignore')
         print(utils.encode(line))
         curr_season = eps.season
 
@@ -248,26 +295,44 @@ def display_specials(show, header=False):
         print ("\nSpecials")
         print ("---------")
 
-    for eps in show.specials:
-        line = show.formatter.display(eps).encode(Settings.encoding, 'ignore')
+    for line in show.formatter.display_many(show.specials):
+        line = line.encode(Settings.encoding, 'ignore')
         print(utils.encode(line))
 
 
-def verify_files(files):
+def verify_files(files, force=False, jobs=None, digest=None):
     """
     Verify the file by using the given checksum and comparing it to a newly
-    computed checksum
+    computed checksum, force ignores the checksums stored in the cache.
+    Results are printed as they finish followed by a summary sorted by name
     """
+    files = list(files)
+
     for f in files:
         if not f.checksum:
             print("Episode {} dosen't have a checksum to compare to".format(f.name))
-            continue
 
-        if f.verify_integrity():
+    results = []
+    for f, passed in utils.verify_files(files, force, jobs, digest):
+        if passed:
             print("Episode {} has passed verification".format(f.name))
         else:
             print("Episode {} has failed verification".format(f.name))
 
+        results.append((f.name, passed))
+
+    if not results:
+        return
+
+    results.sort()
+    failed = [name for name, passed in results if not passed]
+
+    print("\n{} of {} episodes passed verification".format(
+          len(results) - len(failed), len(results)))
+
+    for name in failed:
+        print("FAILED {}".format(name))
+
 
 def print_renamed_files(files):
     """
@@ -1,67 +1,289 @@
 # -*- coding: utf-8 -*-
 """
 Provides the logic for polling web sources.  Any python source in the
-web_sources directory that has a poll method defined will be imported.  The
-imported modules will then be iterated over and have their poll method called
-until one of them returns a list of episodes.  The user can create their
-own web source just by defining a poll method and saving the source in the
-web_sources directory.
+web_sources directory that has a poll method defined will be imported, as
+will any object registered under the 'eplist.web_sources' setuptools entry
+point group.  The sources will then be iterated over and have their poll
+method called until one of them returns a list of episodes.  The user can
+create their own web source just by defining a poll method and saving the
+source in the web_sources directory.
+
+The sources are only discovered once and aren't imported until the first
+show is looked up, after that the same sorted list is used for the rest of
+the process.
+
+By default every source is polled at the same time on its own thread.  The
+result of a source is only used once every source with a higher priority
+has come back empty handed or run out of time, so the outcome is the same as
+polling them in order but a lookup takes as long as the slowest source
+rather than all of them together.
+
+A source that raises, or runs out of time, hasn't answered whether it knows
+the show.  If none of the other sources found it the lookup raises a
+PollError rather than reporting the show as missing.
 """
 from __future__ import unicode_literals
 
-import sys
+import time
 import logging
+import importlib
+import threading
 
 from os import listdir
+from os.path import splitext
+from functools import partial
+from collections import OrderedDict
 
+from eplist import utils
 from eplist import constants
 
+from eplist.settings import Settings
 
-def locate_show(title):
-    """Polls the web sources looking for the show"""
-    modules = []
+if Settings.py3k:
+    from queue import Queue, Empty
+else:
+    from Queue import Queue, Empty
+
+
+class SourceRegistry(object):
+    """
+    Keeps track of the web sources that can be polled.  Sources are found in
+    the package directory and through the entry point group, each one is
+    loaded the first time the list of sources is needed
+    """
+    def __init__(self, package='eplist.web_sources', group='eplist.web_sources'):
+        self.package = package
+        self.group = group
+        self._lock = threading.RLock()
+        self._loaders = None
+        self._sources = None
+
+    def loaders(self):
+        """
+        Returns an ordered dictionary of source names to the functions that
+        load them, nothing is imported until a loader is called
+        """
+        with self._lock:
+            if self._loaders is None:
+                self._loaders = self._discover()
+
+            return self._loaders
 
-    sys.path.append(constants.web_sources_path)
-    # This will import all the modules within the web_sources directory so that
-    # we can easily plug in new sources for finding episode information so long
-    # as they define a poll function
+    def _discover(self):
+        """ Find the sources without importing any of them """
+        loaders = OrderedDict()
 
-    for mod in listdir(constants.web_sources_path):
-        if mod.endswith('.py') and not mod.startswith('__'):
-            logging.info("Importing web resource {}".format(mod[:-3]))
+        package = importlib.import_module(self.package)
+        for path in package.__path__:
+            for filename in sorted(listdir(path)):
+                name, ext = splitext(filename)
+                if ext == '.py' and not name.startswith('__'):
+                    module = '{}.{}'.format(self.package, name)
+                    loaders.setdefault(name, partial(importlib.import_module, module))
 
-            module = __import__(mod[:-3])
-            if not hasattr(module, 'poll'):
-                logging.error("Module {} doesn't have a poll method defined, ignoring module".format(mod))
+        for entry_point in _entry_points(self.group):
+            if entry_point.name in loaders:
+                logging.warning("Web source {} is already defined, ignoring the "
+                                "entry point".format(entry_point.name))
                 continue
 
-            if not hasattr(module, 'priority'):
-                logging.error("Module {} doesn't have a priority defined, defaulting to 0".format(mod))
-                module.priority = 0
+            loaders[entry_point.name] = entry_point.load
 
-            modules.append(module)
+        logging.info("Found web sources: {}".format(', '.join(loaders)))
 
-    # If the modules have a poll priority we will respect it
-    # by sorting the list by priority, higher number have higher precedence
-    modules = sorted(modules, key=lambda x: x.priority, reverse=True)
+        return loaders
 
-    logging.info("Searching for {}".format(title))
+    def register(self, name, load):
+        """
+        Add a source under the name given, load is called to get the module
+        or object with the poll method when the sources are next needed
+        """
+        with self._lock:
+            self.loaders()[name] = load
+            self._sources = None
 
-    episodes = constants.show_not_found
+    def sources(self):
+        """
+        Returns the sources that can be polled sorted by priority, higher
+        numbers have higher precedence.  They are loaded on the first call
+        """
+        with self._lock:
+            if self._sources is None:
+                self._sources = self._load()
 
-    for source in modules:
-        logging.info("Polling {0}".format(source.__name__))
+            return self._sources
 
-        episodes = source.poll(title)
+    def _load(self):
+        sources = []
 
-        if episodes:
-            logging.info("located {0}".format(title))
-            break
+        for name, load in self.loaders().items():
+            logging.info("Importing web resource {}".format(name))
+
+            try:
+                source = load()
+            except Exception:
+                logging.exception("Unable to import web source {}, ignoring it".format(name))
+                continue
+
+            if not hasattr(source, 'poll'):
+                logging.error("Module {} doesn't have a poll method defined, ignoring module".format(name))
+                continue
+
+            if not hasattr(source, 'priority'):
+                logging.error("Module {} doesn't have a priority defined, defaulting to 0".format(name))
+                source.priority = 0
+
+            sources.append(source)
+
+        return sorted(sources, key=lambda x: x.priority, reverse=True)
+
+    def reset(self):
+        """ Forget every source so they are discovered again """
+        with self._lock:
+            self._loaders = None
+            self._sources = None
+
+
+def _entry_points(group):
+    """ The setuptools entry points in the group, if setuptools is around """
+    try:
+        import pkg_resources
+    except ImportError:
+        return []
+
+    return list(pkg_resources.iter_entry_points(group))
+
+
+registry = SourceRegistry()
+
+## Stands in for the result of a source that failed or timed out
+_failed = object()
+
+
+def locate_show(title):
+    """
+    Polls the web sources looking for the show.  Raises a PollError if the
+    show wasn't found but some of the sources failed to answer
+    """
+    modules = registry.sources()
+
+    logging.info("Searching for {}".format(title))
+
+    if Settings.concurrent_polling:
+        episodes, failed = _poll_concurrently(title, modules)
+    else:
+        episodes, failed = _poll_sequentially(title, modules)
 
-        msg = "Unable to locate {0} at {1}".format(title, source.__name__)
-        logging.info(msg)
+    if not episodes and failed:
+        raise utils.PollError("Unable to poll {} for {}".format(', '.join(failed), title))
 
     if not episodes:
         logging.info("Unable to locate the show: " + title)
 
     return sorted(episodes, key=lambda ep: ep.number)
+
+
+def _poll_sequentially(title, modules):
+    """
+    Poll each source in order until one finds the show.  Returns the
+    episodes and the names of the sources that failed
+    """
+    failed = []
+
+    for source in modules:
+        episodes = _poll(source, title)
+
+        if episodes is _failed:
+            failed.append(_source_name(source))
+        elif episodes:
+            logging.info("located {0}".format(title))
+            return episodes, failed
+
+    return constants.show_not_found, failed
+
+
+def _poll_concurrently(title, modules):
+    """
+    Poll every source at once and return the episodes from the highest
+    priority source that found the show.  Sources that haven't answered by
+    their timeout are given up on, their threads can't be stopped but
+    whatever they return is ignored.  Returns the episodes and the names of
+    the sources that failed or timed out
+    """
+    results = Queue()
+    pending = object()
+    status = [pending] * len(modules)
+    deadlines = []
+
+    start = time.time()
+    for index, source in enumerate(modules):
+        deadlines.append(start + getattr(source, 'timeout', Settings.poll_timeout))
+
+        thread = threading.Thread(target=_poll_source,
+                                  args=(source, title, index, results))
+        thread.daemon = True
+        thread.start()
+
+    while True:
+        # Walk down the priorities, a result can only be used once every
+        # source ahead of it has failed
+        for index, episodes in enumerate(status):
+            if episodes is pending:
+                break
+
+            if episodes is not _failed and episodes:
+                logging.info("located {0} at {1}".format(title, _source_name(modules[index])))
+                return episodes, _failed_sources(modules, status)
+        else:
+            return constants.show_not_found, _failed_sources(modules, status)
+
+        now = time.time()
+        waiting = min(d for d, s in zip(deadlines, status) if s is pending)
+
+        try:
+            index, episodes = results.get(timeout=max(waiting - now, 0))
+            if status[index] is pending:
+                status[index] = episodes
+        except Empty:
+            for index, deadline in enumerate(deadlines):
+                if status[index] is pending and deadline <= time.time():
+                    logging.warning("Timed out polling {} for {}".format(
+                                    _source_name(modules[index]), title))
+                    status[index] = _failed
+
+
+def _poll_source(source, title, index, results):
+    """ Thread target for _poll_concurrently """
+    results.put((index, _poll(source, title)))
+
+
+def _poll(source, title):
+    """
+    Poll a single source, returns its episodes or _failed if the source
+    raised rather than answering
+    """
+    name = _source_name(source)
+    logging.info("Polling {0}".format(name))
+
+    try:
+        episodes = source.poll(title)
+    except utils.PollError as reason:
+        logging.error("Error polling {}: {}".format(name, reason))
+        return _failed
+    except Exception:
+        logging.exception("Error polling {}".format(name))
+        return _failed
+
+    if not episodes:
+        logging.info("Unable to locate {0} at {1}".format(title, name))
+
+    return episodes
+
+
+def _failed_sources(modules, status):
+    """ The names of the sources that failed or timed out """
+    return [_source_name(m) for m, s in zip(modules, status) if s is _failed]
+
+
+def _source_name(source):
+    return getattr(source, '__name__', type(source).__name__)
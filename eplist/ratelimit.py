@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a token bucket rate limiter to avoid flooding the websites that are
+polled.  Every host has its own bucket that refills at a steady rate up to a
+burst size.  A request that finds the bucket empty isn't refused, it is given
+the next free slot and only waits until then, so concurrent requests to the
+same host are spaced out rather than all sleeping for the same delay.
+"""
+from __future__ import unicode_literals, division
+
+import time
+import logging
+import threading
+
+from eplist.settings import Settings
+
+
+class TokenBucket(object):
+    """
+    Allows rate requests a second on average with bursts of up to burst
+    requests.  Keeps track of how long callers have been throttled for
+    """
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("The rate must be positive")
+
+        self.rate = float(rate)
+        self.burst = max(burst, 1)
+        self.throttled = 0.0
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token and returns the number of seconds until it may be
+        used, if the bucket is empty the token is borrowed from the future
+        """
+        with self._lock:
+            now = time.time()
+            elapsed = max(now - self._updated, 0)
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+            self._tokens -= 1
+            delay = max(-self._tokens / self.rate, 0)
+            self.throttled += delay
+
+        return delay
+
+
+class RateLimiter(object):
+    """
+    Keeps a token bucket for each host.  The rate and burst of a host come
+    from the poll_rates setting, or poll_rate and poll_burst for any host
+    that isn't listed there
+    """
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host):
+        """ Returns the token bucket for the host, creating it if needed """
+        with self._lock:
+            if host not in self._buckets:
+                rate, burst = Settings.poll_rates.get(
+                    host, (Settings.poll_rate, Settings.poll_burst))
+                self._buckets[host] = TokenBucket(rate, burst)
+
+            return self._buckets[host]
+
+    def acquire(self, host):
+        """ Waits for the next slot for the host, returns the time waited """
+        delay = self.bucket(host).reserve()
+
+        if delay:
+            logging.info("Throttling requests to {} for {:.2f} seconds".format(host, delay))
+            time.sleep(delay)
+
+        return delay
+
+    def throttled(self, host=None):
+        """
+        Returns the number of seconds requests have been throttled for, to
+        the host given or to every host
+        """
+        with self._lock:
+            if host is not None:
+                bucket = self._buckets.get(host)
+                return bucket.throttled if bucket else 0.0
+
+            return sum(b.throttled for b in self._buckets.values())
+
+    def reset(self):
+        """ Forget every bucket so the settings are read again """
+        with self._lock:
+            self._buckets.clear()
+
+
+## The limiter shared by every request the program makes
+limiter = RateLimiter()
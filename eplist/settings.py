@@ -28,6 +28,27 @@ Settings = AttributeDict({
     ## Days to wait to update the show within the database
     'db_update': 7,
 
+    ## Serve expired shows from the database while fetching a fresh copy in
+    ## the background rather than making the user wait on the web sources
+    'db_stale_while_revalidate': True,
+
+    ## Seconds to wait for background refreshes to finish when closing the cache
+    'db_refresh_wait': 60,
+
+    ## Budgets for the database, once the cache holds more shows or episodes
+    ## than this the least recently used shows are evicted.  0 is unlimited
+    'db_max_shows': 0,
+    'db_max_episodes': 0,
+
+    ## Hours to remember that a show couldn't be found before polling again
+    'not_found_ttl': 6,
+
+    ## Seconds a connection will wait on a locked database before giving up
+    'db_timeout': 30,
+
+    ## Number of shows kept in memory in front of the database, 0 disables it
+    'memory_cache_size': 32,
+
     ## Where to store the old filenames from the last rename operation
     'rename_backup': 'last_rename.json',
 
@@ -38,6 +59,63 @@ Settings = AttributeDict({
     ## Time in seconds between polling a website, recommended is 2
     'poll_delay': 2,
 
+    ## Requests a second allowed to a website on average and how many can be
+    ## made at once before that kicks in.  Hosts listed in poll_rates use
+    ## their own (rate, burst), AniDB asks for no more than one every two
+    ## seconds
+    'poll_rate': 1,
+    'poll_burst': 4,
+    'poll_rates': {
+        'api.anidb.net': (0.5, 1),
+    },
+
+    ## Poll every web source at once rather than one after another, the
+    ## result from the source with the highest priority is still preferred
+    'concurrent_polling': True,
+
+    ## Seconds to wait for a web source when polling concurrently, a source
+    ## can set its own by defining a timeout
+    'poll_timeout': 30,
+
+    ## Seconds to wait to connect to a website and to wait for it to send
+    ## data, and the number of connections kept open to each website
+    'http_connect_timeout': 5,
+    'http_read_timeout': 30,
+    'http_pool_size': 10,
+
+    ## Times to retry a failed request, the delay between retries doubles
+    ## starting at http_backoff seconds but never goes past http_backoff_max
+    'http_retries': 3,
+    'http_backoff': 0.5,
+    'http_backoff_max': 30,
+
+    ## Keep downloaded pages in this folder within the resources folder so
+    ## they are only downloaded again when they have changed
+    'http_cache': True,
+    'http_cache_dir': 'http_cache',
+
+    ## Pages that haven't been used for this many days are removed from the
+    ## http cache when the cache is compacted
+    'http_cache_max_age': 30,
+
+    ## Size in bytes of the blocks files are read in when they are hashed and
+    ## whether to map the files into memory rather than reading them
+    'hash_block_size': 2 ** 20,
+    'hash_use_mmap': False,
+
+    ## Save the progress of hashing a file every time this many bytes have
+    ## been read so an interrupted run can resume, 0 disables it
+    'hash_checkpoint_size': 256 * 2 ** 20,
+
+    ## Number of files to checksum at once when verifying, 0 uses one thread
+    ## per CPU
+    'verify_jobs': 0,
+
+    ## Digest used to verify files with a 32 digit checksum in their name, an
+    ## eight digit checksum is always a CRC32.  One of md5 or ed2k, ed2k is
+    ## slow unless hashlib provides MD4
+    'verify_digest': 'md5',
+
     ## AniDB flat file with the ids of the shows
     ## http://anidb.net/api/animetitles.dat.gz
     'anidb_username': None,
@@ -12,6 +12,7 @@ from eplist import poll_sources
 from eplist import utils
 
 from eplist.episode import Show
+from eplist.settings import Settings
 
 
 class ShowFinder(object):
@@ -49,27 +50,64 @@ class ShowFinder(object):
             logging.info("Show found in database")
             return self.show
 
+        # We recently looked for the show and couldn't find it
+        if self.cache and self.cache.is_not_found(self.show.proper_title):
+            logging.error("Show was recently not found, check spelling and try again")
+            return self.show
+
         # The show was not in the database so now we try the website
         logging.info("Show not found in database, polling web")
-        self.show.add_episodes(self._parseHTMLData())
+        try:
+            episodes = self._parseHTMLData()
+        except utils.PollError as reason:
+            # Not every source answered so the show may still exist, don't
+            # remember it as missing
+            logging.error("{}, try again later".format(reason))
+            return self.show
+
+        self.show.add_episodes(episodes)
 
         if not self.show.episodes:
             logging.error("Show was not found, check spelling and try again")
+            if self.cache:
+                self.cache.add_not_found(self.show.proper_title)
             return self.show
 
         # If we successfully find the show from the internet then
         # we should add it to our database for later use
         if self.cache:
-            logging.info("Adding show to the database")
-            self.cache.add_show(self.show.proper_title, self.show.episodes,
-                                self.show.specials)
+            logging.info("Updating the show in the database")
+            title = self._canonicalTitle(episodes)
+            self.cache.refresh_show(title, self.show.episodes + self.show.specials)
+
+            # Remember the spelling we searched with so it's found locally
+            if title != self.show.proper_title:
+                logging.info("Adding alias {} for {}".format(self.show.proper_title, title))
+                self.cache.add_alias(self.show.proper_title, title)
 
         return self.show
 
+    def _canonicalTitle(self, episodes):
+        """ The web sources may tell us the series' own title, use it as the
+        database key so every spelling of the show maps to the same entry """
+        series = getattr(episodes[0], 'series', None) if episodes else None
+
+        if series:
+            return utils.prepare_title(series.lower()) or self.show.proper_title
+
+        return self.show.proper_title
+
     def _parseCacheData(self):
         """The query should return a positive show id otherwise
-        it's not in the database"""
-        return self.cache.get_episodes(self.show.proper_title)
+        it's not in the database.  Expired shows are refreshed from the
+        web in the background when stale-while-revalidate is enabled"""
+        refresh = None
+
+        if Settings.db_stale_while_revalidate:
+            title = self.show.title
+            refresh = lambda: poll_sources.locate_show(title)
+
+        return self.cache.get_episodes(self.show.proper_title, refresh=refresh)
 
     def _parseHTMLData(self):
         """ Passes the sites contents through the regex to seperate episode
@@ -9,40 +9,168 @@ import os
 import sys
 import json
 import time
+import random
 import logging
+import threading
+
+from email.utils import parsedate_tz, mktime_tz
+
+from functools import partial
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from eplist import constants
 
 from eplist.settings import Settings
+from eplist.ratelimit import limiter
+from eplist.http_cache import HTTPCache
 
 import requests
 
 if Settings.py3k:
-    from urllib.parse import quote_plus
+    from urllib.parse import quote_plus, urlparse
     basestring = bytes
     unicode = str
     raw_input = input
     xrange = range
 else:
     from urllib import quote_plus
+    from urlparse import urlparse
+
+
+_session = None
+_http_cache = None
+_session_lock = threading.Lock()
+_access_lock = threading.Lock()
 
+## Responses with these status codes are worth asking for again
+retry_statuses = frozenset([429, 500, 502, 503, 504])
 
-def get_url_descriptor(url):
+
+def get_session():
     """
-    Returns an url descriptor or None on failure
+    Returns the requests session shared by the whole process, connections
+    to the web sources are pooled and kept alive between requests
     """
-    try:
-        resp = requests.get(url)
-    except requests.exceptions.ConnectionError:
-        logging.error("Error connecting to {}".format(url))
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=Settings.http_pool_size,
+                pool_maxsize=Settings.http_pool_size)
+
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+
+        return _session
+
+
+def get_http_cache():
+    """
+    Returns the cache of downloaded pages in the resources folder, or None if
+    the http_cache setting is off
+    """
+    global _http_cache
+
+    if not Settings.http_cache:
         return None
 
-    if resp.ok:
-        return resp
+    with _session_lock:
+        if _http_cache is None:
+            directory = os.path.join(constants.resource_path, Settings.http_cache_dir)
+            _http_cache = HTTPCache(directory)
+
+        return _http_cache
+
+
+class PollError(Exception):
+    """
+    Raised when a web source couldn't give an answer, as opposed to
+    answering that it doesn't know the show
+    """
+
+
+def get_url_descriptor(url, raise_errors=False):
+    """
+    Returns an url descriptor or None on failure.  Requests are rate
+    limited per host.  Connection errors, timeouts and responses that are
+    likely to be temporary are retried with an exponential backoff.  Pages
+    in the http cache are only downloaded again if they have changed.  With
+    raise_errors a PollError is raised once the retries run out, None is
+    then only returned when the server answered that the page is missing
+    """
+    session = get_session()
+    cache = get_http_cache()
+    timeout = (Settings.http_connect_timeout, Settings.http_read_timeout)
+    host = urlparse(url).hostname
+    headers = cache.conditional_headers(url) if cache else {}
+
+    for attempt in xrange(Settings.http_retries + 1):
+        limiter.acquire(host)
+
+        resp = None
+        try:
+            resp = session.get(url, timeout=timeout, headers=headers)
+        except requests.exceptions.Timeout:
+            logging.error("Timed out connecting to {}".format(url))
+        except requests.exceptions.ConnectionError:
+            logging.error("Error connecting to {}".format(url))
+        else:
+            if resp.status_code == 304 and headers:
+                cached = cache.load(url, resp)
+                if cached is not None:
+                    logging.info("{} hasn't changed, using the cached copy".format(url))
+                    return cached
+
+                # The saved copy has gone missing, ask for the whole page
+                headers = {}
+                continue
+
+            if resp.ok:
+                if cache:
+                    cache.store(url, resp)
+                return resp
+
+            if resp.status_code not in retry_statuses:
+                return None
+
+            logging.error("{} responded with {}".format(url, resp.status_code))
+
+        if attempt < Settings.http_retries:
+            delay = retry_delay(attempt, resp)
+            logging.warning("Retrying {} in {:.1f} seconds".format(url, delay))
+            time.sleep(delay)
+
+    if raise_errors:
+        raise PollError("Unable to reach {}".format(url))
 
     return None
 
 
+def retry_delay(attempt, resp=None):
+    """
+    Returns the number of seconds to wait before retrying a request for the
+    attempt-th time, counting from 0.  A Retry-After header on the response
+    is honoured, otherwise it is a random delay up to an exponentially
+    growing limit
+    """
+    limit = Settings.http_backoff_max
+
+    retry_after = resp.headers.get('Retry-After') if resp is not None else None
+    if retry_after:
+        retry_after = retry_after.strip()
+        if retry_after.isdigit():
+            return min(int(retry_after), limit)
+
+        date = parsedate_tz(retry_after)
+        if date:
+            return min(max(mktime_tz(date) - time.time(), 0), limit)
+
+    return random.uniform(0, min(Settings.http_backoff * 2 ** attempt, limit))
+
+
 def is_valid_file(filename):
     """
     Returns true if the filename is a valid video file
@@ -52,6 +180,19 @@ def is_valid_file(filename):
     return os.path.isfile(filename) and ext in constants.video_extensions
 
 
+def file_identity(path):
+    """
+    Returns a (device, inode, size, mtime) tuple identifying the contents of
+    the file or None if the platform doesn't provide inode numbers
+    """
+    info = os.stat(path)
+
+    if not info.st_ino:
+        return None
+
+    return (info.st_dev, info.st_ino, info.st_size, info.st_mtime)
+
+
 ##############################
 ## Renaming utility functions
 ##############################
@@ -121,9 +262,10 @@ def regex_search(filename):
     return result
 
 
-def clean_filenames(path):
+def clean_filenames(path, cache=None):
     """
-    Attempts to extract order information about the files passed
+    Attempts to extract order information about the files passed, if a cache
+    is passed the files will use it to store their checksums
     """
     from eplist import episode
 
@@ -138,16 +280,53 @@ def clean_filenames(path):
             info['path'] = os.path.join(path, file_)
             info['ext'] = os.path.splitext(info['path'])[1]
             info['name'] = encode(os.path.split(info['path'])[1])
+            info['cache'] = cache
 
             yield episode.EpisodeFile(info)
 
 
-def prepare_filenames(path, show):
+def verify_files(files, force=False, jobs=None, digest=None):
+    """
+    Verifies the checksums of the files using a pool of threads and yields
+    (file, passed) tuples as each one finishes, so the order isn't the same
+    as the files were given in.  Files without a checksum are skipped, digest
+    is passed on to EpisodeFile.verify_integrity
+    """
+    from eplist import hashing
+
+    if (digest or Settings.verify_digest) == 'ed2k' and not hashing.native_md4:
+        logging.warning("hashlib doesn't provide MD4, ED2K digests will be "
+                        "calculated in pure python which is very slow")
+
+    jobs = jobs or Settings.verify_jobs or cpu_count()
+    pool = ThreadPool(jobs)
+
+    try:
+        verify = partial(_verify_file, force=force, digest=digest)
+        for result in pool.imap_unordered(verify, (f for f in files if f.checksum)):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _verify_file(file_, force=False, digest=None):
+    """ Worker for verify_files, a file that can't be read fails """
+    try:
+        return file_, file_.verify_integrity(force, digest)
+    except (IOError, OSError) as e:
+        logging.error("Unable to verify {}: {}".format(file_.name, e))
+        return file_, False
+
+
+def prepare_filenames(path, show, cache=None):
     """
     Rename the files located in 'path' to those in the list 'show', modifies
     the show objects episodeList/specialsList
     """
-    for file_ in clean_filenames(os.path.abspath(path)):
+    matched = []
+
+    for file_ in clean_filenames(os.path.abspath(path), cache):
         if file_.is_special:
             episode_data = show.get_special(file_.special_number)
 
@@ -165,14 +344,24 @@ def prepare_filenames(path, show):
             logging.info(msg)
             continue
 
-        # attach the episode_data file to the corresponding episode_data entry
-        episode_data.file = file_
+        matched.append((file_, episode_data))
+
+    def attach_files():
+        """
+        Attach each file to its episode just before it is formatted, the
+        same episode may be matched by more than one file
+        """
+        for file_, episode_data in matched:
+            episode_data.file = file_
+            yield episode_data
 
-        new_name = show.formatter.display(episode_data) + file_.ext
-        new_name = replace_invalid_path_chars(new_name)
+    names = show.formatter.display_many(attach_files())
+
+    for (file_, episode_data), new_name in zip(matched, names):
+        new_name = replace_invalid_path_chars(new_name + file_.ext)
         new_name = os.path.join(path, trim_long_filename(new_name))
 
-        episode_data.file.new_name = new_name
+        file_.new_name = new_name
 
         yield (file_.path, new_name)
 
@@ -418,22 +607,26 @@ show_not_found = constants.show_not_found
 
 def able_to_poll(site, delay=None, wait=False):
     """
-    Prevents flooding by waiting two seconds from the last poll
+    Prevents flooding by waiting two seconds from the last poll.  The times
+    are saved between runs so it is used for limits that span a long time,
+    such as downloading the AniDB titles once a day, requests to websites are
+    rate limited in get_url_descriptor
     """
     if not delay:
         delay = Settings.poll_delay
 
-    if not Settings.access_dict:
-        Settings.access_dict = load_last_access_times()
+    with _access_lock:
+        if not Settings.access_dict:
+            Settings.access_dict = load_last_access_times()
 
-    last_access = Settings.access_dict.get(site, -1)
-    now = int(time.time())
+        last_access = Settings.access_dict.get(site, -1)
+        now = int(time.time())
 
-    flooding = True
+        flooding = True
 
-    if (last_access < 0) or (now - last_access >= delay):
-        Settings.access_dict[site] = now
-        flooding = False
+        if (last_access < 0) or (now - last_access >= delay):
+            Settings.access_dict[site] = now
+            flooding = False
 
     if flooding and wait:
         logging.warn('Possible flooding of "{}" detected"'.format(site))
@@ -476,11 +669,12 @@ def save_last_access_times():
     """
     Save the last access times dictionary to a file in resources
     """
-    if not Settings.access_dict:
-        return False
+    with _access_lock:
+        if not Settings.access_dict:
+            return False
 
-    with open_file_in_resources(Settings.access_time_file, 'w') as file_:
-        json.dump(Settings.access_dict, file_)
+        with open_file_in_resources(Settings.access_time_file, 'w') as file_:
+            json.dump(Settings.access_dict, file_)
 
     return True
 
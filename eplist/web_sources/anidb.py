@@ -102,7 +102,7 @@ def _connect_HTTP(aid):
     """
     url = anidb_http_url.format(aid)
 
-    resp = utils.get_url_descriptor(url)
+    resp = utils.get_url_descriptor(url, raise_errors=True)
 
     if resp is None:
         return utils.show_not_found
@@ -110,14 +110,17 @@ def _connect_HTTP(aid):
     soup = Soup(resp.content)
 
     if soup.find('error'):
-        logging.error("Temporally banned from AniDB, most likely due to flooding")
-        return []
+        raise utils.PollError("Temporally banned from AniDB, most likely due to flooding")
 
     episodes = soup.findAll('episode')
 
     if not episodes:
         return utils.show_not_found
 
+    # The main title is the series' own name regardless of the one searched for
+    series = soup.find('title', {'type': 'main'})
+    series = series.getText() if series else None
+
     eplist = []
 
     for e in episodes:
@@ -142,7 +145,8 @@ def _connect_HTTP(aid):
             epNum = int(e.epno.getText()[1:])
             type_ = "OVA"
 
-        e = Episode(title=title, number=epNum, count=epNum, type=type_)
+        e = Episode(title=title, number=epNum, count=epNum, type=type_,
+                    series=series)
 
         eplist.append(e)
 
@@ -162,9 +166,8 @@ def poll(title=""):
 
     logging.info("Found AID: {}".format(aid))
 
-    if utils.able_to_poll('AniDB'):
-        episodes = _connect_HTTP(aid)
-        if episodes:
-            return episodes
+    episodes = _connect_HTTP(aid)
+    if episodes:
+        return episodes
 
     return utils.show_not_found
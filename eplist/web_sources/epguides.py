@@ -32,7 +32,7 @@ def poll(title):
     cleanTitle = utils.prepare_title(title)
     episodes = []
     url = "http://www.epguides.com/{0}".format(cleanTitle)
-    fd = utils.get_url_descriptor(url)
+    fd = utils.get_url_descriptor(url, raise_errors=True)
 
     if fd is None:
         return utils.show_not_found
@@ -1,23 +1,20 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import io
 import zipfile
 import logging
-import tempfile
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
 
 from eplist import utils
 
 from eplist.episode import Episode
 from eplist.settings import Settings
 
-try:
-    from bs4 import BeautifulSoup as Soup
-except ImportError:
-    try:
-        from BeautifulSoup import BeautifulStoneSoup as Soup
-    except ImportError:
-        logging.critical("Error: BeautifulSoup was not found, unable to parse AniDB")
-
 priority = 1
 
 
@@ -28,23 +25,20 @@ def poll(title):
         logging.warn("The TvDB Api key was not found, unable to poll the TvDB")
         return utils.show_not_found
 
-    try:
-        Soup
-    except NameError:
-        return utils.show_not_found
-
     cleanTitle = utils.quote_plus(title)
 
     #1) First we need to find the series ID
     seriesIdLoc = "http://www.thetvdb.com/api/GetSeries.php?seriesname={0}".format(cleanTitle)
-    seriesFileDesc = utils.get_url_descriptor(seriesIdLoc)
+    seriesFileDesc = utils.get_url_descriptor(seriesIdLoc, raise_errors=True)
 
     if seriesFileDesc is None:
         return utils.show_not_found
 
-    seriesIdXml = Soup(seriesFileDesc.content, convertEntities=Soup.HTML_ENTITIES)
-
-    seriesIds = seriesIdXml.findAll('series')
+    try:
+        seriesIds = list(_iter_records(io.BytesIO(seriesFileDesc.content), 'series'))
+    except ElementTree.ParseError:
+        logging.exception("Unable to parse the series listing from TvDB")
+        raise utils.PollError("Bad series listing from TvDB")
 
     if not seriesIds:
         return utils.show_not_found
@@ -52,38 +46,46 @@ def poll(title):
     ## TODO: Handle the series conflicts in a sane manner
     if len(seriesIds) > 1:
         logging.warn("Conflict with series title ID on TVdB")
-        for seriesName in seriesIdXml.findAll('seriesname'):
-            logging.info("Alternate series: {}".format(seriesName.getText()))
+        for series in seriesIds:
+            logging.info("Alternate series: {}".format(series.get('seriesname')))
 
-    seriesID = seriesIds[0].seriesid.getString()
-    seriesIdXml.close()
+    seriesID = seriesIds[0].get('seriesid')
+    seriesName = seriesIds[0].get('seriesname')
+
+    if not seriesID:
+        return utils.show_not_found
 
     #2) Get base info zip file
     infoLoc = "http://www.thetvdb.com/api/{0}/series/{1}/all/en.zip".format(api_key, seriesID)
-    infoFileDesc = utils.get_url_descriptor(infoLoc)
+    infoFileDesc = utils.get_url_descriptor(infoLoc, raise_errors=True)
     if infoFileDesc is None:
         return utils.show_not_found
 
-    tempZip = tempfile.TemporaryFile(suffix='.zip')
-    tempZip.seek(0)
-    tempZip.write(infoFileDesc.content)
-
-    with zipfile.ZipFile(tempZip) as z:
-        if 'en.xml' not in z.namelist():
-            logging.error("English episode list was not found")
-            return utils.show_not_found
-
-        with z.open('en.xml') as d:
-            soup = Soup(d, convertEntities=Soup.HTML_ENTITIES)
-
-    #3) Now we have the xml data in the soup variable, just populate the list
+    #3) Read the episodes straight out of the zip as the xml is parsed
+    try:
+        with zipfile.ZipFile(io.BytesIO(infoFileDesc.content)) as z:
+            if 'en.xml' not in z.namelist():
+                logging.error("English episode list was not found")
+                return utils.show_not_found
+
+            with z.open('en.xml') as d:
+                return list(_parse_episodes(d, seriesName))
+    except (zipfile.BadZipfile, ElementTree.ParseError):
+        logging.exception("Unable to parse the episode listing from TvDB")
+        raise utils.PollError("Bad episode listing from TvDB")
+
+
+def _parse_episodes(source, seriesName):
+    """
+    Yields an Episode for each episode in the TvDB series xml as it is read
+    from the file like object
+    """
     count = 1
-    eps = []
 
-    for data in soup.findAll('episode'):
-        name = data.episodename.getText()
-        season = int(data.seasonnumber.getText())
-        num = int(data.episodenumber.getText())
+    for data in _iter_records(source, 'episode'):
+        name = data.get('episodename', '')
+        season = int(data['seasonnumber'])
+        num = int(data['episodenumber'])
         type_ = 'Episode'
 
         if name == "":
@@ -93,17 +95,32 @@ def poll(title):
         if 'commentary' in name.lower():
             continue
 
-        if int(season) < 0:
+        if season < 0:
             type_ = "OVA"
             count = num
             season = 1
 
-        eps.append(Episode(name=name, number=num, season=season,
-                           count=count, type=type_))
+        yield Episode(title=name, number=num, season=season,
+                      count=count, type=type_, series=seriesName)
 
         count += 1
 
-    soup.close()
-    tempZip.close()
 
-    return eps
+def _iter_records(source, tag):
+    """
+    Incrementally parse the xml and yield a dictionary of the text of the
+    children of each element named tag, keyed by their lower cased names.
+    Every element is cleared once it has been read so memory use doesn't
+    grow with the size of the document
+    """
+    # cElementTree on python 2 only accepts byte string event names
+    context = ElementTree.iterparse(source, events=(str('start'), str('end')))
+    _, root = next(context)
+
+    for event, elem in context:
+        if event == 'end' and elem.tag.lower() == tag:
+            yield dict((child.tag.lower(), (child.text or '').strip())
+                       for child in elem)
+
+            elem.clear()
+            root.clear()
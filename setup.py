@@ -35,7 +35,7 @@ setup(
     ],
     requires=[
         "BeautifulSoup (>=3.2.0)",
-        "requests (>=0.9.1)",
+        "requests (>=2.4)",
     ],
     entry_points={
         'console_scripts': ['eplist = eplist.main:main']
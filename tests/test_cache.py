@@ -3,11 +3,17 @@
 __author__ = 'Dan Tracy'
 __email__ = 'djt5019 at gmail dot com'
 
+import os
+import datetime
+import shutil
 import sqlite3
+import tempfile
+import threading
 
 from nose.tools import assert_raises, assert_equal
 from nose.tools import nottest
 
+from eplist import cache as cache_module
 from eplist.cache import Cache
 
 # Mock settings dict
@@ -154,3 +160,426 @@ def test_bad_get_episodes():
     assert_equal(cache.get_episodes(showTitle="test"), [])
 
     cache.close()
+
+
+def test_add_shows():
+    cache = Cache(":memory:")
+
+    shows = []
+    for i in xrange(5):
+        eps, spc = make_series()
+        shows.append(("show {}".format(i), eps, spc))
+
+    assert_equal(cache.add_shows(shows), 5 * 110)
+    assert_equal(len(cache.get_episodes("show 3")), 110)
+
+    ## A bad entry should roll back the whole batch
+    eps, spc = make_series()
+    bad = [("good show", eps, spc), ("", eps, spc)]
+    assert_raises(ValueError, cache.add_shows, bad)
+    assert_equal(cache.get_episodes("good show"), [])
+
+    cache.close()
+
+
+def test_schema_migrations():
+    cache = Cache(":memory:")
+    latest = len(cache_module.migrations)
+
+    assert_equal(cache.schema_version, latest)
+
+    ## Running the migrations again should be a no-op
+    cache.migrate()
+    assert_equal(cache.schema_version, latest)
+
+    cache.recreate_cache()
+    assert_equal(cache.schema_version, latest)
+
+    ## The queries get_episodes looks shows up with are served by the
+    ## covering indexes rather than scanning the tables
+    plan = lambda query, args: ' '.join(
+        row[-1] for row in cache.connection.execute("EXPLAIN QUERY PLAN " + query, args))
+
+    show_plan = plan(cache_module.find_show, ("a", "a"))
+    assert 'shows_title_idx' in show_plan
+    assert 'SCAN shows' not in show_plan
+
+    assert 'episodes_sid_idx' in plan(cache_module.find_episodes, (1,))
+
+    cache.close()
+
+
+def test_migrate_unversioned_database():
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, 'legacy.db')
+
+    try:
+        conn = sqlite3.connect(path)
+        conn.executescript(cache_module.migrations[0])
+        conn.execute("INSERT INTO shows VALUES (NULL, 'legacy', NULL)")
+        conn.commit()
+        conn.close()
+
+        cache = Cache(path)
+        assert_equal(cache.schema_version, len(cache_module.migrations))
+
+        curs = cache.connection.execute("SELECT title FROM shows")
+        assert_equal(curs.fetchall(), [('legacy',)])
+        cache.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_concurrent_migrations():
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, 'concurrent.db')
+
+    caches = []
+    errors = []
+
+    def worker():
+        try:
+            caches.append(Cache(path))
+        except Exception as e:
+            errors.append(e)
+
+    try:
+        threads = [threading.Thread(target=worker) for _ in xrange(8)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+
+        assert_equal(errors, [])
+
+        curs = caches[0].connection.execute("SELECT version FROM schema_version")
+        versions = [row[0] for row in curs]
+        assert_equal(versions, range(1, len(cache_module.migrations) + 1))
+    finally:
+        [cache.close() for cache in caches]
+        shutil.rmtree(temp_dir)
+
+
+def test_threaded_connections():
+    temp_dir = tempfile.mkdtemp()
+    cache = Cache(os.path.join(temp_dir, 'threaded.db'))
+
+    try:
+        journal = cache.connection.execute("PRAGMA journal_mode").fetchone()
+        assert_equal(journal[0].lower(), 'wal')
+
+        eps, spc = make_series()
+        cache.add_show("test show", eps, spc)
+
+        connections = []
+        errors = []
+
+        def worker(num):
+            try:
+                connections.append(cache.connection)
+                cache.add_show("show {}".format(num), eps, spc)
+                assert_equal(len(cache.get_episodes("test show")), 110)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in xrange(8)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+
+        assert_equal(errors, [])
+        assert_equal(len(set(id(c) for c in connections)), 8)
+        assert cache.connection not in connections
+    finally:
+        cache.close()
+        shutil.rmtree(temp_dir)
+
+
+def test_thread_connections_released():
+    temp_dir = tempfile.mkdtemp()
+    cache = Cache(os.path.join(temp_dir, 'released.db'))
+
+    try:
+        for i in xrange(50):
+            thread = threading.Thread(target=cache.get_episodes, args=("show",))
+            thread.start()
+            thread.join()
+
+        ## The last thread may still be tearing down its locals after join
+        assert len(cache._connections) <= 2
+    finally:
+        cache.close()
+        shutil.rmtree(temp_dir)
+
+
+def test_memory_cache():
+    cache = Cache(":memory:")
+    eps, spc = make_series()
+
+    cache.add_show("test show", eps, spc)
+
+    first = cache.get_episodes("test show")
+    second = cache.get_episodes("test show")
+
+    assert_equal(cache.memory_cache.misses, 1)
+    assert_equal(cache.memory_cache.hits, 1)
+    assert_equal([e.title for e in first], [e.title for e in second])
+
+    ## Every lookup gets its own episodes
+    first[0].file = "episode.mkv"
+    assert_equal(cache.get_episodes("test show")[0].file, None)
+
+    ## Expired entries are never served from memory
+    assert_equal(cache.get_episodes("test show", -1), [])
+    assert_equal(cache.memory_cache.misses, 2)
+    assert_equal(len(cache.get_episodes("test show")), 110)
+
+    cache.add_show("test show", eps, spc)
+    cache.get_episodes("test show")
+    sid = cache.connection.execute("SELECT sid FROM shows").fetchone()[0]
+    cache.remove_show(sid)
+    assert_equal(len(cache.memory_cache), 0)
+    assert_equal(cache.get_episodes("test show"), [])
+
+    cache.close()
+
+
+def test_memory_cache_eviction():
+    memory = cache_module.MemoryCache(2)
+
+    memory.put('a', 1)
+    memory.put('b', 2)
+    memory.get('a')
+    memory.put('c', 3)
+
+    assert_equal(memory.get('b'), None)
+    assert_equal(memory.get('a'), 1)
+    assert_equal(memory.get('c'), 3)
+    assert_equal(memory.get('c', lambda entry: False), None)
+    assert_equal(len(memory), 1)
+
+
+def test_stale_while_revalidate():
+    cache = Cache(":memory:")
+    eps, spc = make_series()
+
+    cache.add_show("test show", eps, spc)
+
+    fresh = [MockEpisode("New Episode", 1, 1, 1)]
+    calls = []
+
+    def refresh():
+        calls.append(True)
+        return fresh
+
+    stale = cache.get_episodes("test show", -1, refresh=refresh)
+    assert_equal(len(stale), 110)
+
+    cache.wait_for_refreshes()
+    assert_equal(len(calls), 1)
+
+    eps = cache.get_episodes("test show")
+    assert_equal([e.title for e in eps], ["New Episode"])
+
+    ## A failed refresh keeps the stale copy around
+    stale = cache.get_episodes("test show", -1, refresh=lambda: [])
+    cache.wait_for_refreshes()
+    assert_equal(len(cache.get_episodes("test show")), 1)
+
+    cache.close()
+
+
+def test_enforce_budget():
+    cache = Cache(":memory:")
+    eps, spc = make_series()
+
+    for i in xrange(4):
+        cache.add_show("show {}".format(i), eps, spc)
+
+    ## Reading a show marks it as recently used
+    cache.get_episodes("show 0")
+
+    assert_equal(cache.enforce_budget(max_shows=2), 2)
+    assert_equal(len(cache.get_episodes("show 0")), 110)
+    assert_equal(len(cache.get_episodes("show 3")), 110)
+    assert_equal(cache.get_episodes("show 1"), [])
+
+    assert_equal(cache.enforce_budget(max_episodes=200), 1)
+    assert_equal(cache.enforce_budget(max_episodes=200), 0)
+
+    cache.close()
+
+
+def test_enforce_budget_memory_hits():
+    cache = Cache(":memory:")
+    eps, spc = make_series()
+
+    for title in "abc":
+        cache.add_show(title, eps, spc)
+
+    ## Reads don't write to the database, their access times are saved
+    ## once the budget is enforced
+    changes = cache.connection.total_changes
+    for title in "abca":
+        cache.get_episodes(title)
+    assert_equal(cache.connection.total_changes, changes)
+
+    ## The last read of a was served from memory but still counts
+    assert_equal(cache.memory_cache.hits, 1)
+    assert_equal(cache.enforce_budget(max_shows=2), 1)
+    assert_equal(len(cache.get_episodes("a")), 110)
+    assert_equal(len(cache.get_episodes("c")), 110)
+    assert_equal(cache.get_episodes("b"), [])
+
+    cache.close()
+
+
+def test_compact():
+    cache = Cache(":memory:")
+    eps, spc = make_series()
+
+    cache.add_show("old show", eps, spc)
+    cache.connection.execute("UPDATE shows SET time='2000-01-01 00:00:00'")
+    cache.connection.commit()
+    cache.add_show("new show", eps, spc)
+
+    assert_equal(cache.compact(), 1)
+    assert_equal(cache.get_episodes("old show", refresh=lambda: []), [])
+    assert_equal(len(cache.get_episodes("new show")), 110)
+
+    cache.close()
+
+
+def test_snapshot_round_trip():
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, 'snapshot.gz')
+
+    source = Cache(":memory:")
+    eps, spc = make_series()
+    eps.append(MockEpisode("Ünïcödé", 100, 2, 100))
+    source.add_show("test show", eps, spc)
+    source.add_show("other show", eps[:5], [])
+
+    target = Cache(":memory:")
+    target.add_show("test show", eps[:1], [])
+
+    try:
+        assert_equal(source.export_snapshot(path), 2)
+        assert_equal(target.import_snapshot(path), 2)
+
+        original = source.get_episodes("test show")
+        imported = target.get_episodes("test show")
+
+        assert_equal([(e.title, e.season, e.number, e.count, e.type) for e in original],
+                     [(e.title, e.season, e.number, e.count, e.type) for e in imported])
+        assert_equal(len(target.get_episodes("other show")), 5)
+
+        with open(path, 'wb') as f:
+            f.write(b"not a snapshot")
+        assert_raises(IOError, target.import_snapshot, path)
+    finally:
+        source.close()
+        target.close()
+        shutil.rmtree(temp_dir)
+
+
+def test_not_found():
+    cache = Cache(":memory:")
+
+    assert not cache.is_not_found("missing show")
+
+    cache.add_not_found("missing show")
+    cache.add_not_found("other show")
+    assert cache.is_not_found("missing show")
+    assert not cache.is_not_found("missing show", ttl=0)
+
+    ## Finding the show clears the negative entry
+    eps, spc = make_series()
+    cache.add_show("missing show", eps, spc)
+    assert not cache.is_not_found("missing show")
+
+    assert_equal(cache.purge_not_found(ttl=1), 0)
+    assert_equal(cache.purge_not_found(), 1)
+    assert not cache.is_not_found("other show")
+
+    cache.close()
+
+
+def test_aliases():
+    cache = Cache(":memory:")
+    eps, spc = make_series()
+
+    cache.add_show("juunikokuki", eps, spc)
+
+    assert not cache.add_alias("twelvekingdoms", "missing show")
+    assert cache.add_alias("twelvekingdoms", "juunikokuki")
+    assert_equal(len(cache.get_episodes("twelvekingdoms")), 110)
+
+    ## Replacing the show keeps its aliases
+    cache.add_show("juunikokuki", eps[:10], [])
+    assert_equal(len(cache.get_episodes("twelvekingdoms")), 10)
+
+    cache.remove_show(cache.connection.execute("SELECT sid FROM shows").fetchone()[0])
+    assert_equal(cache.get_episodes("twelvekingdoms"), [])
+    assert_equal(cache.connection.execute("SELECT * FROM aliases").fetchall(), [])
+
+    cache.close()
+
+
+def test_alias_conflicts():
+    cache = Cache(":memory:")
+    eps, spc = make_series()
+    titles = lambda show: [e.title for e in cache.get_episodes(show)]
+    shows = lambda: cache.connection.execute("SELECT title FROM shows").fetchall()
+
+    ## The show was first stored under the title searched with, later a
+    ## source tells us the series' own title
+    cache.add_show("twelvekingdoms", eps[:3], [])
+    cache.add_show("juunikokuki", eps[:3], [])
+    assert cache.add_alias("twelvekingdoms", "juunikokuki")
+
+    assert_equal(titles("twelvekingdoms"), [e.title for e in eps[:3]])
+    assert_equal(shows(), [("juunikokuki",)])
+
+    ## The aliased show went stale and a source without the series' title
+    ## stored the alias as a show of its own
+    cache.connection.execute("UPDATE shows SET time=?",
+                             (datetime.datetime(2000, 1, 1),))
+    cache.refresh_show("twelvekingdoms", eps[3:5])
+
+    assert_equal(titles("twelvekingdoms"), [e.title for e in eps[3:5]])
+    assert_equal(cache.connection.execute("SELECT * FROM aliases").fetchall(), [])
+
+    cache.close()
+
+
+def test_refresh_show():
+    cache = Cache(":memory:")
+    eps, spc = make_series()
+
+    assert_equal(cache.refresh_show("test show", eps + spc), (110, 0, 0))
+    sid = cache.connection.execute("SELECT sid FROM shows").fetchone()[0]
+    eids = [row[0] for row in cache.connection.execute("SELECT eid FROM episodes")]
+
+    ## Nothing changed so nothing is written
+    assert_equal(cache.refresh_show("test show", eps + spc), (0, 0, 0))
+
+    ## A new episode, a retitled one and a special that went away
+    eps.append(MockEpisode("Episode 100", 100, 1, 100))
+    eps[5] = MockEpisode("Renamed", 5, 1, 5)
+    assert_equal(cache.refresh_show("test show", eps + spc[1:]), (1, 1, 1))
+
+    titles = [e.title for e in cache.get_episodes("test show")]
+    assert_equal(len(titles), 110)
+    assert_equal(titles[5], "Renamed")
+    assert_equal(titles[-1], "Episode 100")
+    assert "Special 0" not in titles
+
+    ## The show and the rows that didn't change keep their ids
+    assert_equal(cache.connection.execute("SELECT sid FROM shows").fetchone()[0], sid)
+    kept = [row[0] for row in cache.connection.execute("SELECT eid FROM episodes")]
+    assert_equal(set(eids) - set(kept), set([eids[100]]))
+
+    ## Expired shows are kept around to be merged into
+    assert_equal(cache.get_episodes("test show", -1), [])
+    assert_equal(cache.refresh_show("test show", eps + spc[1:]), (0, 0, 0))
+    assert_equal(len(cache.get_episodes("test show")), 110)
+
+    cache.close()
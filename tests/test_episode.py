@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Dan Tracy'
+__email__ = 'djt5019 at gmail dot com'
+
+import gc
+import os
+import zlib
+import hashlib
+import shutil
+import tempfile
+
+from eplist import utils
+from eplist.cache import Cache
+from eplist.episode import Episode, EpisodeFile, EpisodeFormatter, Show
+
+from nose.tools import assert_equal, assert_raises, with_setup
+
+
+temp_dir = None
+
+
+def setup_temp_dir():
+    global temp_dir
+    temp_dir = tempfile.mkdtemp()
+
+
+def teardown_temp_dir():
+    shutil.rmtree(temp_dir)
+
+
+def make_file(name, data):
+    path = os.path.join(temp_dir, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    return EpisodeFile(path=path, name=name, checksum=None)
+
+
+def test_episode_record():
+    ep = Episode(title="Pilot", number="1", season="2", extra="kept")
+
+    assert_equal(ep.title, "Pilot")
+    assert_equal(ep['number'], 1)
+    assert_equal(ep.get('season'), 2)
+    assert_equal(ep.count, -1)
+    assert_equal(ep.extra, "kept")
+    assert not ep.is_special
+    assert not hasattr(ep, '__dict__') or 'title' not in ep.__dict__
+
+    assert Episode(title="OVA", number=1, type="OVA").is_special
+
+    ## Looking fields up doesn't give a record without extra fields a
+    ## dictionary of its own
+    ep = Episode(title="Pilot", number=1)
+    assert 'title' in ep and 'extra' not in ep
+    assert_equal(ep.get('extra'), None)
+    assert_equal(len(ep.keys()), 8)
+    assert not any(isinstance(r, dict) for r in gc.get_referents(ep))
+
+
+def test_episode_file_record():
+    ep = EpisodeFile({'path': '/tmp/show - 01.mkv', 'episode_number': 1,
+                      'checksum': None, 'group': '[group]'})
+
+    assert not ep.is_special
+    assert 'path' in ep
+    assert 'special_number' not in ep
+    assert_equal(ep.get('special_number'), None)
+    assert_equal(ep['group'], '[group]')
+    assert_raises(KeyError, lambda: ep['special_number'])
+    assert_raises(AttributeError, lambda: ep.special_number)
+
+    ep['special_number'] = 2
+    assert ep.is_special
+    assert_equal(sorted(ep.keys()), ['checksum', 'episode_number', 'group',
+                                     'path', 'special_number'])
+
+
+def make_show():
+    eps = []
+    count = 1
+    for season in (1, 2):
+        for num in xrange(1, 13):
+            eps.append(Episode(title="S{}E{}".format(season, num), number=num,
+                               season=season, count=count))
+            count += 1
+
+    for num in xrange(1, 4):
+        eps.append(Episode(title="OVA {}".format(num), number=num, count=num,
+                           type="OVA"))
+
+    return Show("test show", eps)
+
+
+def test_show_lookups():
+    show = make_show()
+
+    assert_equal(show.num_episodes, 24)
+    assert_equal(show.max_episode, 12)
+    assert_equal(show.num_seasons, 2)
+    assert_equal(show.num_specials, 3)
+
+    assert_equal(show.get_episode(5, 1).title, "S1E5")
+    assert_equal(show.get_episode(5, 2).title, "S2E5")
+    assert_equal(show.get_episode(17, 1).title, "S2E5")
+    assert_equal(show.get_episode(30, 1), None)
+    assert_equal(show.get_special(2).title, "OVA 2")
+    assert_equal(show.get_special(9), None)
+    assert_equal(len(show.get_season(2)), 12)
+    assert_equal(show.get_season(3), [])
+
+    ## Re-adding a subset rebuilds the indexes rather than accumulating
+    show.add_episodes(show.get_season(2))
+    assert_equal(show.num_seasons, 2)
+    assert_equal(show.num_specials, 0)
+    assert_equal(len(show.get_season(2)), 12)
+    assert_equal(show.get_season(1), [])
+
+    empty = Show("empty")
+    assert_equal((empty.max_episode, empty.num_seasons, empty.num_specials), (0, 0, 0))
+
+
+def test_formatter():
+    show = make_show()
+    episode = show.get_episode(5, 2)
+    special = show.get_special(1)
+
+    formatter = EpisodeFormatter(show, "<series:upper> - S<season:pad>E<epnum:pad> - <title:lower>")
+    assert_equal(formatter.display(episode), "TEST SHOW - S2E05 - s2e5")
+
+    formatter.format_string = "<show> <count:pad> <type:upper> <bogus:pad> \\<title> [<hash>]"
+    assert_equal(formatter.display(episode), "Test Show 17 EPISODE <bogus> <title> [00000000]")
+    assert_equal(formatter.display(special), "Test Show 1 OVA <bogus> <title> [00000000]")
+
+    ## Swapping the show is picked up without recompiling
+    formatter.show = Show("another show")
+    assert_equal(formatter.display(special), "Another Show 1 OVA <bogus> <title> [00000000]")
+
+
+def test_display_many():
+    show = make_show()
+    formatter = EpisodeFormatter(show, "<series> <season:pad>x<epnum:pad> <title>")
+    episodes = show.episodes + show.specials
+
+    lines = formatter.display_many(episodes)
+    assert not isinstance(lines, list)
+    assert_equal(list(lines), [formatter.display(e) for e in episodes])
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_prepare_filenames():
+    show = make_show()
+    show.formatter = EpisodeFormatter(show, "<series> - <count:pad> [<hash>]")
+
+    make_file("[group] test show - 01 [DEADBEEF].mkv", b"")
+    make_file("[group] test show - 02.mkv", b"data")
+    make_file("[group] test show - 99.mkv", b"")
+
+    renamed = sorted(utils.prepare_filenames(temp_dir, show))
+    names = [os.path.split(new)[1] for _, new in renamed]
+
+    assert_equal(names, ["Test Show - 01 [deadbeef].mkv",
+                         "Test Show - 02 [adf3f363].mkv"])
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_crc32():
+    data = os.urandom(2 ** 16)
+    ep = make_file("episode.mkv", data)
+
+    assert_equal(ep.crc32(), zlib.crc32(data) & 0xFFFFFFFF)
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_stored_crc32():
+    cache = Cache(":memory:")
+    data = os.urandom(2 ** 16)
+    expected = zlib.crc32(data) & 0xFFFFFFFF
+
+    ep = make_file("episode.mkv", data)
+    ep.cache = cache
+
+    assert_equal(ep.crc32(), expected)
+
+    ## Unchanged files use the stored result rather than being read again
+    identity = utils.file_identity(ep.path)
+    cache.store_digests(identity, {'crc32': "{:08x}".format(1234)})
+    assert_equal(ep.crc32(), 1234)
+    assert_equal(ep.crc32(force=True), expected)
+    assert_equal(cache.get_digests(identity)['crc32'], "{:08x}".format(expected))
+
+    ## Changing the file invalidates the stored result
+    with open(ep.path, 'ab') as f:
+        f.write(b'more data')
+    os.utime(ep.path, (0, 0))
+
+    assert_equal(ep.crc32(), zlib.crc32(data + b'more data') & 0xFFFFFFFF)
+
+    cache.close()
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_verify_files():
+    files = []
+    expected = []
+    for i in range(20):
+        data = os.urandom(2 ** 12)
+        ep = make_file("episode {}.mkv".format(i), data)
+
+        ## Every third file has the wrong checksum
+        checksum = zlib.crc32(data) & 0xFFFFFFFF
+        ep.checksum = "{:08X}".format(checksum + (i % 3 == 0))
+
+        files.append(ep)
+        expected.append((ep.name, i % 3 != 0))
+
+    files.append(make_file("unchecked.mkv", b'data'))
+
+    for jobs in (1, 4):
+        results = utils.verify_files(files, jobs=jobs)
+        assert_equal(sorted((f.name, passed) for f, passed in results),
+                     sorted(expected))
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_digests():
+    cache = Cache(":memory:")
+    data = os.urandom(2 ** 16)
+    crc = "{:08x}".format(zlib.crc32(data) & 0xFFFFFFFF)
+    md5 = hashlib.md5(data).hexdigest()
+
+    ep = make_file("episode.mkv", data)
+    ep.cache = cache
+
+    assert_equal(ep.digests(['md5']), {'md5': md5})
+
+    ## The CRC was calculated in the same pass and stored with the MD5
+    identity = utils.file_identity(ep.path)
+    assert_equal(cache.get_digests(identity), {'crc32': crc, 'md5': md5})
+    assert_equal(ep.crc32(), int(crc, base=16))
+
+    digests = ep.digests()
+    assert_equal(sorted(digests), ['crc32', 'ed2k', 'md5'])
+    assert_equal(cache.get_digests(identity), digests)
+
+    ## Longer checksums are verified with the digest asked for, MD5 unless
+    ## the settings say otherwise
+    ep.checksum = md5.upper()
+    assert ep.verify_integrity(digest='md5')
+    assert not ep.verify_integrity(digest='ed2k')
+    assert ep.verify_integrity()
+
+    ## Eight digit checksums are always CRC32s
+    ep.checksum = crc
+    assert ep.verify_integrity()
+    assert ep.verify_integrity(digest='md5')
+
+    cache.close()
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_hash_tags():
+    show = make_show()
+    data = os.urandom(2 ** 12)
+    episode = show.get_episode(1, 1)
+    episode.file = make_file("episode.mkv", data)
+
+    formatter = EpisodeFormatter(show, "<title> [<hash:upper>] <hash:md5>")
+    expected = "S1E1 [{:08X}] {}".format(zlib.crc32(data) & 0xFFFFFFFF,
+                                         hashlib.md5(data).hexdigest())
+    assert_equal(formatter.display(episode), expected)
+
+    ## The checksum from the filename is used for the CRC
+    episode.file.checksum = "DEADBEEF"
+    assert_equal(formatter.display(episode).split()[1], "[DEADBEEF]")
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_resumed_digests():
+    cache = Cache(":memory:")
+    data = os.urandom(2 ** 16)
+
+    ep = make_file("episode.mkv", data)
+    ep.cache = cache
+    identity = utils.file_identity(ep.path)
+
+    ## Pretend an earlier run got to the end of the file before stopping
+    cache.store_checkpoint(identity, ['crc32'], len(data), {'crc32': 1234})
+    assert_equal(cache.get_checkpoint(identity, ['crc32']), (len(data), {'crc32': 1234}))
+    assert_equal(cache.get_checkpoint(identity, ['crc32', 'ed2k']), None)
+
+    assert_equal(ep.crc32(), 1234)
+    assert_equal(cache.get_checkpoint(identity, ['crc32']), None)
+
+    ## Forcing a rehash starts from the beginning
+    cache.store_checkpoint(identity, ['crc32'], len(data), {'crc32': 1234})
+    assert_equal(ep.crc32(force=True), zlib.crc32(data) & 0xFFFFFFFF)
+
+    cache.close()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Dan Tracy'
+__email__ = 'djt5019 at gmail dot com'
+
+import io
+import os
+import zlib
+import hashlib
+import tempfile
+
+from binascii import hexlify
+
+from eplist import hashing
+from eplist.hashing import FileHasher, MD4
+
+from nose.tools import assert_equal, assert_raises
+
+
+def hash_data(data, **kwargs):
+    fd, path = tempfile.mkstemp(suffix='.mkv')
+    try:
+        os.write(fd, data)
+        os.close(fd)
+        hasher = FileHasher(**kwargs)
+        return hasher, hasher.crc32(path)
+    finally:
+        os.remove(path)
+
+
+def test_crc32_blocks():
+    data = os.urandom(100000)
+    expected = zlib.crc32(data) & 0xFFFFFFFF
+
+    for block_size in (1, 4096, 99999, 100000, 2 ** 20):
+        for use_mmap in (False, True):
+            hasher, checksum = hash_data(data, block_size=block_size,
+                                         use_mmap=use_mmap)
+            assert_equal(checksum, expected)
+            assert_equal(hasher.bytes_read, len(data))
+
+
+def test_crc32_empty_file():
+    for use_mmap in (False, True):
+        hasher, checksum = hash_data(b'', use_mmap=use_mmap)
+        assert_equal(checksum, 0)
+        assert_equal(hasher.bytes_read, 0)
+
+
+class ShortReads(object):
+    """ A file that never reads more than a few thousand bytes at once """
+    def __init__(self, file_):
+        self.file_ = file_
+
+    def fileno(self):
+        return self.file_.fileno()
+
+    def seek(self, offset):
+        return self.file_.seek(offset)
+
+    def readinto(self, buf):
+        return self.file_.readinto(memoryview(buf)[:4000])
+
+
+def test_short_reads():
+    data = os.urandom(100000)
+    fd, path = tempfile.mkstemp(suffix='.mkv')
+    try:
+        os.write(fd, data)
+        os.close(fd)
+
+        hasher = FileHasher(block_size=2 ** 16, use_mmap=False)
+        with io.open(path, 'rb', buffering=0) as file_:
+            blocks = [bytes(block) for block in hasher._blocks(ShortReads(file_))]
+
+        assert_equal([len(block) for block in blocks], [2 ** 16, 100000 - 2 ** 16])
+        assert_equal(b''.join(blocks), data)
+    finally:
+        os.remove(path)
+
+
+def test_md4():
+    ## Test suite from RFC 1320
+    vectors = [
+        (b"", "31d6cfe0d16ae931b73c59d7e0c089c0"),
+        (b"a", "bde52cb31de33e46245e05fbdbd6fb24"),
+        (b"abc", "a448017aaf21d8525fc10ae87aa6729d"),
+        (b"message digest", "d9130a8164549fe818874806e1c7014b"),
+        (b"abcdefghijklmnopqrstuvwxyz", "d79e1c308aa5bbcdeea8ed63df412da9"),
+        (b"1234567890" * 8, "e33b4ddc9c38f2199c3e7b164fcc0536"),
+    ]
+
+    for data, expected in vectors:
+        md4 = MD4()
+        md4.update(data)
+        assert_equal(md4.hexdigest(), expected)
+
+    ## Feeding the data in pieces gives the same result
+    md4 = MD4()
+    for i in range(0, 80, 7):
+        md4.update((b"1234567890" * 8)[i:i + 7])
+    assert_equal(md4.hexdigest(), vectors[-1][1])
+
+
+def ed2k(data, chunk_size):
+    """ Reference ED2K implementation """
+    hashes = []
+    for offset in range(0, len(data) or 1, chunk_size):
+        md4 = MD4()
+        md4.update(data[offset:offset + chunk_size])
+        hashes.append(md4.digest())
+
+    if len(hashes) == 1:
+        return hexlify(hashes[0]).decode('ascii')
+
+    md4 = MD4()
+    md4.update(b''.join(hashes))
+    return md4.hexdigest()
+
+
+def test_digests():
+    data = os.urandom(10000)
+    hasher = FileHasher(block_size=3000)
+
+    fd, path = tempfile.mkstemp(suffix='.mkv')
+    os.write(fd, data)
+    os.close(fd)
+
+    old_chunk_size = hashing.ed2k_chunk_size
+    try:
+        for chunk_size in (1000, 4096, 10000, 2 ** 20):
+            hashing.ed2k_chunk_size = chunk_size
+            digests = hasher.digests(path)
+
+            assert_equal(digests['crc32'], "{:08x}".format(zlib.crc32(data) & 0xFFFFFFFF))
+            assert_equal(digests['md5'], hashlib.md5(data).hexdigest())
+            assert_equal(digests['ed2k'], ed2k(data, chunk_size))
+    finally:
+        hashing.ed2k_chunk_size = old_chunk_size
+        os.remove(path)
+
+    ## Only one read of the file for every digest
+    assert_equal(hasher.bytes_read, len(data) * 4)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_resume():
+    data = os.urandom(10000)
+
+    fd, path = tempfile.mkstemp(suffix='.mkv')
+    os.write(fd, data)
+    os.close(fd)
+
+    def interrupt(offset, state):
+        checkpoints.append((offset, state))
+        raise Interrupted()
+
+    old_chunk_size = hashing.ed2k_chunk_size
+    hashing.ed2k_chunk_size = 3000
+    try:
+        for names in (['crc32'], ['crc32', 'ed2k']):
+            for use_mmap in (False, True):
+                expected = FileHasher().digests(path, names)
+
+                checkpoints = []
+                hasher = FileHasher(block_size=1400, use_mmap=use_mmap,
+                                    checkpoint_size=2500)
+                assert_raises(Interrupted, hasher.digests, path, names,
+                              checkpoint=interrupt)
+
+                ## ED2K can only be saved at the end of a chunk
+                offset = checkpoints[0][0]
+                assert_equal(offset, 3000 if 'ed2k' in names else 2800)
+
+                hasher = FileHasher(block_size=1400, use_mmap=use_mmap)
+                assert_equal(hasher.digests(path, names, checkpoints[0]), expected)
+                assert_equal(hasher.bytes_read, len(data) - offset)
+
+        ## MD5 can't be saved so no checkpoints are made
+        checkpoints = []
+        hasher = FileHasher(block_size=1000, checkpoint_size=1000)
+        hasher.digests(path, ['crc32', 'md5'], checkpoint=interrupt)
+        assert_equal(checkpoints, [])
+    finally:
+        hashing.ed2k_chunk_size = old_chunk_size
+        os.remove(path)
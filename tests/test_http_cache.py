@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Dan Tracy'
+__email__ = 'djt5019 at gmail dot com'
+
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equal, with_setup
+
+from eplist.http_cache import HTTPCache
+
+from tests.test_utils import FakeResponse, fetch
+
+temp_dir = None
+url = "http://example.com"
+
+
+def setup_temp_dir():
+    global temp_dir
+    temp_dir = tempfile.mkdtemp()
+
+
+def teardown_temp_dir():
+    shutil.rmtree(temp_dir)
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_store_and_load():
+    cache = HTTPCache(temp_dir)
+    assert_equal(cache.conditional_headers(url), {})
+    assert_equal(cache.load(url), None)
+
+    ## Pages that can't be revalidated aren't saved
+    assert not cache.store(url, FakeResponse(200, {}, b'page'))
+    assert not cache.store(url, FakeResponse(200, {'ETag': '"1"', 'Cache-Control': 'no-store'}))
+
+    headers = {'ETag': '"v1"', 'Last-Modified': 'Sat, 01 Jan 2000 00:00:00 GMT',
+               'Content-Type': 'text/xml', 'Content-Length': '4'}
+    assert cache.store(url, FakeResponse(200, headers, b'page'))
+
+    assert_equal(cache.conditional_headers(url),
+                 {'If-None-Match': '"v1"',
+                  'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'})
+    assert_equal(cache.conditional_headers("http://example.com/other"), {})
+
+    resp = cache.load(url, FakeResponse(304, {'ETag': '"v2"'}))
+    assert resp.ok
+    assert_equal(resp.content, b'page')
+    assert_equal(resp.text, 'page')
+    assert_equal(resp.headers['etag'], '"v2"')
+    assert 'Content-Length' not in resp.headers
+
+    ## The new validators are sent from now on
+    assert_equal(cache.conditional_headers(url)['If-None-Match'], '"v2"')
+
+    cache.clear()
+    assert_equal(cache.load(url), None)
+    assert_equal(os.listdir(temp_dir), [])
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_clear_unused():
+    cache = HTTPCache(temp_dir)
+    other = "http://example.com/other"
+
+    for page in (url, other):
+        assert cache.store(page, FakeResponse(200, {'ETag': '"v1"'}, b'page'))
+
+    ## A page that was last used long ago is removed
+    _, meta_path = cache._paths(other)
+    os.utime(meta_path, (0, 0))
+
+    assert_equal(cache.clear(30), 1)
+    assert_equal(cache.load(other), None)
+    assert_equal(cache.load(url).content, b'page')
+    assert_equal(len(os.listdir(temp_dir)), 2)
+
+
+@with_setup(setup_temp_dir, teardown_temp_dir)
+def test_revalidation():
+    cache = HTTPCache(temp_dir)
+    page = FakeResponse(200, {'ETag': '"v1"'}, b'page')
+
+    resp, _, session = fetch([page], cache)
+    assert resp is page
+    assert_equal(session.headers, [{}])
+
+    ## An unchanged page is served from the cache
+    resp, _, session = fetch([FakeResponse(304)], cache)
+    assert_equal(resp.content, b'page')
+    assert_equal(session.headers, [{'If-None-Match': '"v1"'}])
+
+    ## A changed page replaces the saved copy
+    changed = FakeResponse(200, {'ETag': '"v2"'}, b'changed')
+    resp, _, session = fetch([changed], cache)
+    assert resp is changed
+    assert_equal(cache.load(url).content, b'changed')
+
+    ## If the saved copy goes missing the whole page is asked for again
+    cache.clear()
+    cache.conditional_headers = lambda url: {'If-None-Match': '"v2"'}
+    resp, _, session = fetch([FakeResponse(304), changed], cache)
+    assert resp is changed
+    assert_equal(session.headers, [{'If-None-Match': '"v2"'}, {}])
@@ -2,9 +2,13 @@
 __author__ = 'Dan Tracy'
 __email__ = 'djt5019 at gmail dot com'
 
+from eplist import utils
+from eplist import poll_sources
+from eplist.cache import Cache
+from eplist.episode import Episode
 from eplist.show_finder import ShowFinder
 
-from nose.tools import nottest
+from nose.tools import nottest, assert_equal
 
 
 @nottest
@@ -40,3 +44,76 @@ class MockPollSources(object):
 
 def test_get_show():
     parser = ShowFinder()
+
+
+def test_not_found_is_cached():
+    calls = []
+
+    def locate_show(title):
+        calls.append(title)
+        return []
+
+    cache = Cache(":memory:")
+    original = poll_sources.locate_show
+    poll_sources.locate_show = locate_show
+
+    try:
+        parser = ShowFinder("Not A Real Show", cache)
+        assert not parser.getShow().episodes
+        assert not parser.getShow().episodes
+        assert_equal(len(calls), 1)
+
+        cache.purge_not_found()
+        parser.getShow()
+        assert_equal(len(calls), 2)
+    finally:
+        poll_sources.locate_show = original
+        cache.close()
+
+
+def test_failed_lookup_not_cached():
+    calls = []
+
+    def locate_show(title):
+        calls.append(title)
+        raise utils.PollError("Unable to poll tvdb")
+
+    cache = Cache(":memory:")
+    original = poll_sources.locate_show
+    poll_sources.locate_show = locate_show
+
+    try:
+        parser = ShowFinder("Unreachable Show", cache)
+        assert not parser.getShow().episodes
+        assert not cache.is_not_found(parser.show.proper_title)
+
+        parser.getShow()
+        assert_equal(len(calls), 2)
+    finally:
+        poll_sources.locate_show = original
+        cache.close()
+
+
+def test_alias_recorded():
+    calls = []
+
+    def locate_show(title):
+        calls.append(title)
+        return [Episode(title="Episode 1", number=1, count=1, series="Juuni Kokuki")]
+
+    cache = Cache(":memory:")
+    original = poll_sources.locate_show
+    poll_sources.locate_show = locate_show
+
+    try:
+        ShowFinder("Twelve Kingdoms", cache).getShow()
+        assert_equal(len(calls), 1)
+
+        for title in ("Twelve Kingdoms", "12 Kingdoms", "Juuni Kokuki"):
+            show = ShowFinder(title, cache).getShow()
+            assert_equal(show.episodes[0].title, "Episode 1")
+
+        assert_equal(len(calls), 1)
+    finally:
+        poll_sources.locate_show = original
+        cache.close()
@@ -2,11 +2,156 @@
 __author__ = 'Dan Tracy'
 __email__ = 'djt5019 at gmail dot com'
 
+import time
 import unittest
 
+from eplist import utils
 from eplist import poll_sources
+from eplist.poll_sources import SourceRegistry
+from eplist.settings import Settings
+
+
+class FakeSource(object):
+    def __init__(self, name, priority=None, episodes=None, delay=0, timeout=None):
+        self.__name__ = name
+        self.episodes = episodes or []
+        self.delay = delay
+        self.polled = []
+        if priority is not None:
+            self.priority = priority
+        if timeout is not None:
+            self.timeout = timeout
+
+    def poll(self, title):
+        self.polled.append(title)
+        time.sleep(self.delay)
+        if isinstance(self.episodes, Exception):
+            raise self.episodes
+        return self.episodes
+
+
+class Ep(object):
+    def __init__(self, number):
+        self.number = number
+
+
+def locate_show(title, *sources):
+    registry = SourceRegistry()
+    registry._loaders = {}
+
+    for source in sources:
+        registry.register(source.__name__, lambda source=source: source)
+
+    original = poll_sources.registry
+    poll_sources.registry = registry
+    try:
+        return poll_sources.locate_show(title)
+    finally:
+        poll_sources.registry = original
 
 
 class TestPollSources(unittest.TestCase):
     def test(self):
         assert(poll_sources is not None)
+
+    def test_discover(self):
+        registry = SourceRegistry()
+        names = list(registry.loaders())
+
+        for name in ('anidb', 'epguides', 'tvdb'):
+            self.assertTrue(name in names)
+
+        ## Discovering again reuses the first result
+        self.assertTrue(registry.loaders() is registry.loaders())
+
+    def test_lazy_loading(self):
+        registry = SourceRegistry()
+        registry._loaders = {}
+
+        loaded = []
+
+        def loader(name, source):
+            def load():
+                loaded.append(name)
+                return source
+            return load
+
+        registry.register('low', loader('low', FakeSource('low', 1)))
+        registry.register('high', loader('high', FakeSource('high', 5)))
+        registry.register('default', loader('default', FakeSource('default')))
+        registry.register('no poll', loader('no poll', object()))
+
+        self.assertEqual(loaded, [])
+
+        sources = registry.sources()
+        self.assertEqual([s.__name__ for s in sources], ['high', 'low', 'default'])
+        self.assertEqual(sources[-1].priority, 0)
+
+        ## The sorted list is kept for the rest of the process
+        self.assertTrue(registry.sources() is sources)
+        self.assertEqual(len(loaded), 4)
+
+    def test_locate_show(self):
+        for concurrent in (False, True):
+            Settings.concurrent_polling = concurrent
+
+            missing = FakeSource('missing', 10)
+            found = FakeSource('found', 5, [Ep(2), Ep(1)])
+            broken = FakeSource('broken', 3, ValueError("bad page"))
+
+            episodes = locate_show('show', missing, found, broken)
+            self.assertEqual([e.number for e in episodes], [1, 2])
+            self.assertEqual(missing.polled, ['show'])
+
+            if not concurrent:
+                self.assertEqual(broken.polled, [])
+
+        Settings.concurrent_polling = True
+
+    def test_concurrent_priority(self):
+        slow = FakeSource('slow', 10, [Ep(1)], delay=0.3)
+        fast = FakeSource('fast', 1, [Ep(2)])
+        missing = FakeSource('missing', 5, delay=0.2)
+
+        start = time.time()
+        episodes = locate_show('show', slow, fast, missing)
+        elapsed = time.time() - start
+
+        ## The slower but preferred source wins, without waiting on the
+        ## sources one after another
+        self.assertEqual([e.number for e in episodes], [1])
+        self.assertTrue(elapsed < 0.45)
+
+    def test_concurrent_timeout(self):
+        hung = FakeSource('hung', 10, [Ep(1)], delay=1, timeout=0.1)
+        fallback = FakeSource('fallback', 1, [Ep(2)])
+
+        start = time.time()
+        episodes = locate_show('show', hung, fallback)
+
+        self.assertEqual([e.number for e in episodes], [2])
+        self.assertTrue(time.time() - start < 0.5)
+
+        ## Running out of time isn't the same as not knowing the show
+        hung = FakeSource('hung', 10, [Ep(1)], delay=1, timeout=0.1)
+        missing = FakeSource('missing', 1)
+        self.assertRaises(utils.PollError, locate_show, 'show', hung, missing)
+
+    def test_failed_sources(self):
+        for concurrent in (False, True):
+            Settings.concurrent_polling = concurrent
+
+            missing = FakeSource('missing', 10)
+            self.assertEqual(locate_show('show', missing), [])
+
+            broken = FakeSource('broken', 5, utils.PollError("unreachable"))
+            crashed = FakeSource('crashed', 3, ValueError("bad page"))
+            self.assertRaises(utils.PollError, locate_show, 'show',
+                              missing, broken, crashed)
+
+            ## A source that found the show makes up for the failures
+            found = FakeSource('found', 1, [Ep(1)])
+            episodes = locate_show('show', missing, broken, found)
+            self.assertEqual([e.number for e in episodes], [1])
+
+        Settings.concurrent_polling = True
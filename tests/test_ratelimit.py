@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Dan Tracy'
+__email__ = 'djt5019 at gmail dot com'
+
+import time
+import threading
+
+from eplist import ratelimit
+from eplist.ratelimit import TokenBucket, RateLimiter
+from eplist.settings import Settings
+
+from nose.tools import assert_equal, assert_raises, assert_almost_equal
+
+
+def test_token_bucket():
+    assert_raises(ValueError, TokenBucket, 0)
+
+    bucket = TokenBucket(rate=10, burst=3)
+
+    ## The burst goes through right away, after that each request gets the
+    ## next free slot
+    delays = [bucket.reserve() for _ in range(6)]
+    assert_equal(delays[:3], [0, 0, 0])
+    for slot, delay in enumerate(delays[3:], 1):
+        assert_almost_equal(delay, slot * 0.1, places=2)
+
+    assert_almost_equal(bucket.throttled, 0.6, places=2)
+
+
+def test_concurrent_requests():
+    limiter = RateLimiter()
+    old_rates = Settings.poll_rates
+    Settings.poll_rates = {'example.com': (20, 1)}
+
+    waits = []
+
+    def request():
+        waits.append(limiter.acquire('example.com'))
+
+    try:
+        start = time.time()
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+    finally:
+        Settings.poll_rates = old_rates
+
+    ## Each request waited for its own slot rather than all of them sleeping
+    ## for the same delay
+    assert_equal(len(set(round(w, 2) for w in waits)), 5)
+    assert 0.18 <= elapsed < 0.5
+    assert_almost_equal(limiter.throttled('example.com'), sum(waits))
+    assert_equal(limiter.throttled('other.com'), 0)
+    assert_equal(limiter.throttled(), limiter.throttled('example.com'))
+
+
+def test_per_host_buckets():
+    limiter = RateLimiter()
+    anidb = limiter.bucket('api.anidb.net')
+    other = limiter.bucket('www.epguides.com')
+
+    assert_equal((anidb.rate, anidb.burst), (0.5, 1))
+    assert_equal((other.rate, other.burst), (Settings.poll_rate, Settings.poll_burst))
+    assert limiter.bucket('api.anidb.net') is anidb
+    assert isinstance(ratelimit.limiter, RateLimiter)
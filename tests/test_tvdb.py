@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Dan Tracy'
+__email__ = 'djt5019 at gmail dot com'
+
+import io
+import zipfile
+import unittest
+
+from eplist import utils
+from eplist.settings import Settings
+from eplist.web_sources import tvdb
+
+series_xml = b"""<?xml version="1.0" encoding="UTF-8" ?>
+<Data>
+<Series>
+<seriesid>80379</seriesid>
+<language>en</language>
+<SeriesName>The Big Bang Theory</SeriesName>
+</Series>
+<Series>
+<seriesid>12345</seriesid>
+<language>en</language>
+<SeriesName>Big Bang Theory Again</SeriesName>
+</Series>
+</Data>
+"""
+
+episode_xml = u"""<?xml version="1.0" encoding="UTF-8" ?>
+<Data>
+<Series>
+<id>80379</id>
+<SeriesName>The Big Bang Theory</SeriesName>
+<Overview>Lots of text that isn't needed</Overview>
+</Series>
+{}
+</Data>
+"""
+
+episode = u"""<Episode>
+<id>{0}</id>
+<EpisodeName>{1}</EpisodeName>
+<EpisodeNumber>{2}</EpisodeNumber>
+<SeasonNumber>{3}</SeasonNumber>
+</Episode>
+"""
+
+
+def make_episodes(*episodes):
+    xml = episode_xml.format(''.join(episode.format(i, *e) for i, e in enumerate(episodes)))
+    return xml.encode('utf-8')
+
+
+def make_zip(xml, name='en.xml'):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as z:
+        z.writestr(name, xml)
+    return data.getvalue()
+
+
+class FakeResponse(object):
+    def __init__(self, content):
+        self.content = content
+
+
+class TestTVDB(unittest.TestCase):
+    def setUp(self):
+        self.old_get = utils.get_url_descriptor
+        self.old_key = Settings.tvdb_key
+        Settings.tvdb_key = 'key'
+
+    def tearDown(self):
+        utils.get_url_descriptor = self.old_get
+        Settings.tvdb_key = self.old_key
+
+    def serve(self, *pages):
+        requested = []
+        pages = list(pages)
+
+        def get_url_descriptor(url, raise_errors=False):
+            requested.append(url)
+            page = pages.pop(0)
+            if isinstance(page, Exception):
+                raise page
+            return FakeResponse(page) if page is not None else None
+
+        utils.get_url_descriptor = get_url_descriptor
+        return requested
+
+    def test_parse_episodes(self):
+        xml = make_episodes(("Pilot", 1, 1), ("The Big Bran Hypothesis", 2, 1),
+                            ("", 3, 1), ("Commentary", 4, 1),
+                            (u"Caf\xe9 &amp; Co", 1, 2))
+
+        episodes = tvdb._parse_episodes(io.BytesIO(xml), "The Big Bang Theory")
+        self.assertFalse(isinstance(episodes, list))
+
+        episodes = list(episodes)
+        self.assertEqual([e.title for e in episodes],
+                         ["Pilot", "The Big Bran Hypothesis", utils.encode(u"Caf\xe9 & Co")])
+        self.assertEqual([(e.season, e.number, e.count) for e in episodes],
+                         [(1, 1, 1), (1, 2, 2), (2, 1, 3)])
+        self.assertEqual(episodes[0].series, "The Big Bang Theory")
+
+    def test_iter_records(self):
+        records = list(tvdb._iter_records(io.BytesIO(series_xml), 'series'))
+        self.assertEqual([r['seriesid'] for r in records], ['80379', '12345'])
+        self.assertEqual(records[0]['seriesname'], 'The Big Bang Theory')
+
+    def test_poll(self):
+        xml = make_episodes(("Pilot", 1, 1), ("Special", 1, -1))
+        requested = self.serve(series_xml, make_zip(xml))
+
+        episodes = tvdb.poll("big bang theory")
+        self.assertEqual([(e.title, e.type) for e in episodes],
+                         [("Pilot", "Episode"), ("Special", "OVA")])
+        self.assertTrue("/series/80379/all/en.zip" in requested[1])
+
+    def test_poll_failures(self):
+        Settings.tvdb_key = None
+        self.assertEqual(tvdb.poll("show"), [])
+        Settings.tvdb_key = 'key'
+
+        self.serve(None)
+        self.assertEqual(tvdb.poll("show"), [])
+
+        self.serve(b"<Data></Data>")
+        self.assertEqual(tvdb.poll("show"), [])
+
+        self.serve(series_xml, make_zip(b"<Data/>", 'de.xml'))
+        self.assertEqual(tvdb.poll("show"), [])
+
+        ## Pages that couldn't be fetched or read aren't an answer
+        self.serve(utils.PollError("unreachable"))
+        self.assertRaises(utils.PollError, tvdb.poll, "show")
+
+        self.serve(b"not xml")
+        self.assertRaises(utils.PollError, tvdb.poll, "show")
+
+        self.serve(series_xml, b"not a zip")
+        self.assertRaises(utils.PollError, tvdb.poll, "show")
@@ -8,10 +8,14 @@ import tempfile
 import os
 import time
 
+import requests
+
+from email.utils import formatdate
+
 from eplist import utils
 
 from nose.tools import nottest
-from nose.tools import assert_equal, assert_not_equal
+from nose.tools import assert_equal, assert_not_equal, assert_raises
 
 
 temp_dir = None
@@ -62,6 +66,99 @@ def test_get_url_descriptor():
     assert_equal(bad_site, None)
 
 
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None, content=b''):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self.content = content
+        self.encoding = None
+        self.request = None
+
+
+class FakeSession(object):
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.timeouts = []
+        self.headers = []
+
+    def get(self, url, timeout=None, headers=None):
+        self.timeouts.append(timeout)
+        self.headers.append(headers)
+        resp = self.responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+
+class Unlimited(object):
+    def acquire(self, host):
+        return 0
+
+
+@nottest
+def fetch(responses, http_cache=None, raise_errors=False):
+    session = FakeSession(responses)
+    delays = []
+
+    old = utils._session, utils._http_cache, utils.time.sleep, utils.limiter
+    old_setting = utils.Settings.http_cache
+
+    utils._session, utils._http_cache = session, http_cache
+    utils.time.sleep, utils.limiter = delays.append, Unlimited()
+    utils.Settings.http_cache = http_cache is not None
+    try:
+        return (utils.get_url_descriptor("http://example.com", raise_errors),
+                delays, session)
+    finally:
+        utils._session, utils._http_cache, utils.time.sleep, utils.limiter = old
+        utils.Settings.http_cache = old_setting
+
+
+def test_retries():
+    ok = FakeResponse(200)
+    error = requests.exceptions.ConnectionError()
+
+    resp, delays, session = fetch([FakeResponse(503), error, ok])
+    assert resp is ok
+    assert_equal(len(delays), 2)
+    assert_equal(session.timeouts[0], (utils.Settings.http_connect_timeout,
+                                       utils.Settings.http_read_timeout))
+
+    ## Errors that won't go away aren't retried
+    resp, delays, session = fetch([FakeResponse(404)])
+    assert_equal((resp, delays), (None, []))
+
+    ## Give up after the last retry
+    retries = utils.Settings.http_retries
+    resp, delays, session = fetch([FakeResponse(500)] * (retries + 1))
+    assert_equal((resp, len(delays)), (None, retries))
+    assert_equal(session.responses, [])
+
+    ## Failures can be told apart from pages that are missing
+    assert_raises(utils.PollError, fetch, [error] * (retries + 1), raise_errors=True)
+    resp, delays, session = fetch([FakeResponse(404)], raise_errors=True)
+    assert_equal(resp, None)
+
+
+def test_retry_delay():
+    backoff = utils.Settings.http_backoff
+    for attempt in xrange(4):
+        delay = utils.retry_delay(attempt)
+        assert 0 <= delay <= backoff * 2 ** attempt
+
+    assert_equal(utils.retry_delay(0, FakeResponse(503, {'Retry-After': '7'})), 7)
+    assert_equal(utils.retry_delay(0, FakeResponse(503, {'Retry-After': '99999'})),
+                 utils.Settings.http_backoff_max)
+
+    future = formatdate(time.time() + 10)
+    delay = utils.retry_delay(0, FakeResponse(429, {'Retry-After': future}))
+    assert 8 <= delay <= 10
+
+    past = formatdate(time.time() - 10)
+    assert_equal(utils.retry_delay(0, FakeResponse(429, {'Retry-After': past})), 0)
+
+
 def test_is_valid_file():
     fake_files = [
     "C:\\Users\\SomeUser\\Files\\file1.mkv",
@@ -206,3 +303,12 @@ def test_able_to_poll():
 
 def test_update_db():
     pass
+
+
+def test_long_checksum():
+    md5 = "0123456789abcdef0123456789ABCDEF"
+    g = utils.regex_search("[Group] Show - 01 [{}].mkv".format(md5))
+    assert_equal(g['checksum'], md5.lower())
+
+    g = utils.regex_search("[Group] Show - 01 [DEADBEEF].mkv")
+    assert_equal(g['checksum'], "deadbeef")